@@ -1,24 +1,19 @@
-from flask import Flask, request, redirect, session, send_file
-import sqlite3
-import pandas as pd
-import io
+from flask import Flask, request, redirect, session
+import os
+from jinja2 import FileSystemBytecodeCache
+import export
+import database
+import directory
+import ledger
+import invoices
+from database import get_db, get_cred_db
 from staff_dashboard import staff_bp
 from teacher_dashboard import teacher_bp
 from dashboard import dashboard_bp
 from werkzeug.security import generate_password_hash, check_password_hash
 
-# --- Database helpers ---
+# --- Password helpers ---
 
-def get_db():
-    conn = sqlite3.connect('school.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_cred_db():
-    conn = sqlite3.connect('credential.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def is_hashed(password):
     return isinstance(password, str) and password.startswith(("pbkdf2:", "scrypt:", "argon2:"))
 
@@ -81,9 +76,72 @@ def init_db():
                 invoice_no TEXT,
                 file_path TEXT,
                 created_at TEXT,
+                content_hash TEXT,
                 FOREIGN KEY(student_id) REFERENCES students(id)
             )
         ''')
+        columns = [row["name"] for row in db.execute("PRAGMA table_info(invoices)")]
+        if "content_hash" not in columns:
+            db.execute("ALTER TABLE invoices ADD COLUMN content_hash TEXT")
+        if not db.execute("SELECT 1 FROM sqlite_master WHERE name='idx_payments_student'").fetchone():
+            # One-time migration: older databases may hold several payment rows
+            # per student; keep the newest so the unique index below can be
+            # built. Once it exists duplicates cannot be inserted.
+            removed = db.execute('''
+                DELETE FROM payments WHERE id NOT IN (
+                    SELECT MAX(id) FROM payments GROUP BY student_id
+                )
+            ''').rowcount
+            if removed:
+                app.logger.warning('Removed %d older duplicate payment rows before adding idx_payments_student', removed)
+        db.execute('CREATE INDEX IF NOT EXISTS idx_reports_teacher ON reports(teacher_id, id DESC)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_reports_class ON reports(class)')
+        # reports.class may be NULL; the admin list sorts on IFNULL(class, '') so
+        # keyset cursors never compare against NULL.
+        db.execute("CREATE INDEX IF NOT EXISTS idx_reports_class_sort ON reports(IFNULL(class, ''), id)")
+        db.execute('CREATE INDEX IF NOT EXISTS idx_students_teacher ON students(teacher_id)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_students_class ON students(class)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_students_name ON students(name)')
+        db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_student ON payments(student_id)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_payments_next_pay ON payments(next_pay_date)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_payments_status ON payments(status, next_pay_date)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_invoices_student ON invoices(student_id)')
+        db.execute('CREATE INDEX IF NOT EXISTS idx_invoices_created ON invoices(created_at)')
+        db.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_invoices_hash ON invoices(content_hash)')
+        for table, column in database.FTS_TABLES.items():
+            fts = f'{table}_fts'
+            exists = db.execute("SELECT 1 FROM sqlite_master WHERE name=?", (fts,)).fetchone()
+            db.execute(f'''
+                CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5(
+                    {column}, content='{table}', content_rowid='id',
+                    prefix='2 3', tokenize='unicode61 remove_diacritics 2'
+                )
+            ''')
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN
+                    INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                END
+            ''')
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                END
+            ''')
+            db.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {column} ON {table} BEGIN
+                    INSERT INTO {fts}({fts}, rowid, {column}) VALUES ('delete', old.id, old.{column});
+                    INSERT INTO {fts}(rowid, {column}) VALUES (new.id, new.{column});
+                END
+            ''')
+            if not exists:
+                db.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+        database.install_stats(db, 'students')
+        database.install_stats(db, 'reports')
+        ledger.normalize_dates(db)
+        ledger.install_ledger(db)
+        for table in ('students', 'reports', 'payments', 'invoices', 'payment_ledger', 'exchange_rates'):
+            database.install_versioning(db, table)
+        invoices.install_store(db)
     with get_cred_db() as db:
         db.execute('''
             CREATE TABLE IF NOT EXISTS teachers (
@@ -115,11 +173,23 @@ def init_db():
             if "status" not in columns:
                 db.execute(f"ALTER TABLE {table} ADD COLUMN status TEXT DEFAULT 'active'")
                 db.execute(f"UPDATE {table} SET status='active' WHERE status IS NULL")
+            database.install_stats(db, table)
+            # username may be NULL; the admin lists sort on IFNULL(username, '')
+            # so keyset cursors never compare against NULL.
+            db.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_username_sort ON {table}(IFNULL(username, ''), id)")
+        database.install_versioning(db, 'teachers')
 
 # --- Flask App Setup ---
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
+# Templates are compiled once and cached by Jinja; set this to also keep the
+# compiled bytecode on disk so restarted workers skip compilation too.
+app.config['TEMPLATE_BYTECODE_CACHE_DIR'] = os.environ.get('TEMPLATE_BYTECODE_CACHE_DIR')
+if app.config['TEMPLATE_BYTECODE_CACHE_DIR']:
+    os.makedirs(app.config['TEMPLATE_BYTECODE_CACHE_DIR'], exist_ok=True)
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['TEMPLATE_BYTECODE_CACHE_DIR'])
+database.init_app(app)
 app.register_blueprint(staff_bp)
 app.register_blueprint(teacher_bp)
 app.register_blueprint(dashboard_bp)
@@ -229,17 +299,7 @@ def admin_login():
 
 @app.route('/export')
 def export_excel():
-    db = get_db()
-    cred_db = get_cred_db()
-    teachers = {row['id']: row['username'] for row in cred_db.execute('SELECT id, username FROM teachers')}
-    df = pd.read_sql_query('SELECT * FROM reports', db)
-    df['teacher'] = df['teacher_id'].map(teachers)
-    df = df[['teacher', 'class', 'grade', 'student_name', 'student_score', 'teacher_comment']]
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
-    return send_file(output, download_name="report.xlsx", as_attachment=True)
+    return export.xlsx_response(get_db(), 'reports', "report.xlsx")
 
 @app.route('/staff-login', methods=['GET', 'POST'])
 def staff_login():
@@ -324,6 +384,7 @@ def admin_add_user():
                         (username, password_hash)
                     )
                 db.commit()
+                directory.invalidate(f"{user_type}s")
                 message = f"{user_type.capitalize()} added successfully!"
             except Exception as e:
                 message = f"Database Error: {str(e)}"
@@ -416,5 +477,6 @@ def admin_add_user():
     '''
 
 if __name__ == '__main__':
-    init_db()
+    with app.app_context():
+        init_db()
     app.run(debug = True, host='0.0.0.0', port=8001)
@@ -0,0 +1,315 @@
+import os
+import sys
+import time
+import random
+import sqlite3
+import tempfile
+import threading
+import subprocess
+import resource
+
+import database
+import export
+from app import app, init_db
+
+# Usage: python benchmark.py [name ...]   (no names runs every benchmark)
+
+BENCHMARKS = {}
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+# --- Fixture ---
+
+def make_fixture(directory, students=2000, reports=5000, teachers=20):
+    app.config['SCHOOL_DB'] = os.path.join(directory, 'school.db')
+    app.config['CREDENTIAL_DB'] = os.path.join(directory, 'credential.db')
+    database.close_pools()
+    with app.app_context():
+        init_db()
+    rng = random.Random(42)
+    classes = [f'{g}{s}' for g in range(1, 7) for s in 'ABC']
+    cred = sqlite3.connect(app.config['CREDENTIAL_DB'])
+    cred.executemany(
+        'INSERT INTO teachers (id, username, password, gender) VALUES (?, ?, ?, ?)',
+        [(i, f'teacher{i}', 'x', 'Female') for i in range(1, teachers + 1)]
+    )
+    cred.execute("INSERT INTO staffs (id, username, password, gender) VALUES (1, 'staff', 'x', 'Male')")
+    cred.execute("INSERT INTO admins (id, username, password) VALUES (1, 'admin', 'x')")
+    cred.commit()
+    cred.close()
+    db = sqlite3.connect(app.config['SCHOOL_DB'])
+    db.executemany(
+        'INSERT INTO students (name, class, grade, gender, dob, emergency_contact, teacher_id) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        [(f'Student {i}', c, f'Grade {c[0]}', 'Male', '2015-01-01', '012000000', rng.randint(1, teachers))
+         for i, c in ((i, rng.choice(classes)) for i in range(students))]
+    )
+    db.executemany(
+        'INSERT INTO reports (teacher_id, class, grade, student_name, student_score, teacher_comment) VALUES (?, ?, ?, ?, ?, ?)',
+        ((rng.randint(1, teachers), c, f'Grade {c[0]}', f'Student {rng.randrange(students)}', rng.randint(0, 100), 'Good work')
+         for c in (rng.choice(classes) for _ in range(reports)))
+    )
+    db.executemany(
+        'INSERT INTO payments (student_id, amount, pay_date, next_pay_date, status) VALUES (?, ?, ?, ?, ?)',
+        [(i, 120.0, '2026-09-01', '2026-10-01', rng.choice(['Paid', 'Not Paid'])) for i in range(1, students + 1)]
+    )
+    db.commit()
+    db.close()
+
+def client(role=None):
+    c = app.test_client()
+    with c.session_transaction() as sess:
+        if role == 'admin':
+            sess['admin_logged_in'] = True
+        elif role == 'staff':
+            sess['staff_id'] = 1
+        elif role == 'teacher':
+            sess['teacher_id'] = 1
+    return c
+
+def requests_per_second(c, path, seconds=2.0):
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        response = c.get(path)
+        assert response.status_code == 200, (path, response.status_code)
+        response.close()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def report(name, rows):
+    print(f'== {name}')
+    for label, value in rows:
+        print(f'  {label:<40} {value}')
+
+# --- Benchmarks ---
+
+@benchmark
+def connection_pool():
+    with tempfile.TemporaryDirectory() as tmp:
+        make_fixture(tmp, students=200, reports=500)
+        rows = []
+        for path, role in (('/admin', 'admin'), ('/staff-dashboard', 'staff')):
+            for pool_size in (0, database.DEFAULTS['DB_POOL_SIZE']):
+                app.config['DB_POOL_SIZE'] = pool_size
+                database.close_pools()
+                rps = requests_per_second(client(role), path)
+                rows.append((f'{path} pool_size={pool_size}', f'{rps:8.1f} req/s'))
+        database.close_pools()
+        app.config['DB_POOL_SIZE'] = database.DEFAULTS['DB_POOL_SIZE']
+    report('connection_pool', rows)
+
+@benchmark
+def concurrent_read_write():
+    profiles = (('rollback journal', {}), ('tuned profile', database.DEFAULTS['DB_PRAGMAS']))
+    rows = []
+    for label, pragmas in profiles:
+        with tempfile.TemporaryDirectory() as tmp:
+            app.config['DB_PRAGMAS'] = pragmas
+            make_fixture(tmp, students=2000, reports=20000)
+            path = app.config['SCHOOL_DB']
+            stop = threading.Event()
+            counts = {'reads': 0, 'writes': 0, 'locked': 0}
+            lock = threading.Lock()
+
+            def bump(key):
+                with lock:
+                    counts[key] += 1
+
+            def reader():
+                conn = database.connect(path, pragmas)
+                while not stop.is_set():
+                    try:
+                        conn.execute('SELECT * FROM reports ORDER BY id DESC LIMIT 200').fetchall()
+                        conn.execute('SELECT status, COUNT(*), SUM(amount) FROM payments GROUP BY status').fetchall()
+                        bump('reads')
+                    except sqlite3.OperationalError:
+                        bump('locked')
+                conn.close()
+
+            def writer():
+                conn = database.connect(path, pragmas)
+                i = 0
+                while not stop.is_set():
+                    i += 1
+                    try:
+                        conn.execute(
+                            'INSERT INTO reports (teacher_id, class, grade, student_name, student_score, teacher_comment) VALUES (1, ?, ?, ?, ?, ?)',
+                            ('1A', 'Grade 1', f'Writer {i}', i % 100, 'Saved')
+                        )
+                        conn.execute('UPDATE payments SET amount=amount+1 WHERE student_id=?', (i % 2000 + 1,))
+                        conn.commit()
+                        bump('writes')
+                    except sqlite3.OperationalError:
+                        conn.rollback()
+                        bump('locked')
+                conn.close()
+
+            threads = [threading.Thread(target=reader) for _ in range(4)] + [threading.Thread(target=writer) for _ in range(2)]
+            for t in threads:
+                t.start()
+            time.sleep(3.0)
+            stop.set()
+            for t in threads:
+                t.join()
+            rows.append((f'{label} reads', f'{counts["reads"] / 3.0:8.1f} /s'))
+            rows.append((f'{label} writes', f'{counts["writes"] / 3.0:8.1f} /s'))
+            rows.append((f'{label} locked errors', counts['locked']))
+            database.close_pools()
+    app.config['DB_PRAGMAS'] = database.DEFAULTS['DB_PRAGMAS']
+    report('concurrent_read_write', rows)
+
+@benchmark
+def template_cache():
+    env = app.jinja_env
+    rows = []
+    for name in sorted(env.list_templates()):
+        source = env.loader.get_source(env, name)[0]
+        start = time.perf_counter()
+        for _ in range(50):
+            env.from_string(source)
+        compile_us = (time.perf_counter() - start) / 50 * 1e6
+        env.get_template(name)
+        start = time.perf_counter()
+        for _ in range(5000):
+            env.get_template(name)
+        cached_us = (time.perf_counter() - start) / 5000 * 1e6
+        rows.append((name, f'compile {compile_us:8.1f} us   cached {cached_us:6.1f} us'))
+    report('template_cache', rows)
+
+# Each export variant runs in a fresh interpreter so ru_maxrss is its own peak.
+EXPORT_ROWS = int(os.environ.get('BENCH_EXPORT_ROWS', 1000000))
+
+def export_variant(variant, directory):
+    app.config['SCHOOL_DB'] = os.path.join(directory, 'school.db')
+    app.config['CREDENTIAL_DB'] = os.path.join(directory, 'credential.db')
+    app.config['EXPORT_CACHE_DIR'] = os.path.join(directory, 'export-cache')
+    start = time.perf_counter()
+    with app.test_request_context():
+        db = database.get_db()
+        if variant == 'pandas':
+            import io
+            import pandas as pd
+            query, params = export.report_query()
+            df = pd.read_sql_query(query, db, params=params)
+            output = io.BytesIO()
+            with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
+                df.to_excel(writer, index=False)
+            size = len(output.getvalue())
+        else:
+            response = export.xlsx_response(db, 'reports', 'report.xlsx')
+            response.direct_passthrough = False
+            size = sum(len(chunk) for chunk in response.response)
+            response.close()
+    elapsed = time.perf_counter() - start
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{elapsed:.2f} {peak_mb:.1f} {size}')
+
+@benchmark
+def excel_export():
+    rows = []
+    with tempfile.TemporaryDirectory() as tmp:
+        make_fixture(tmp, students=2000, reports=EXPORT_ROWS)
+        database.close_pools()
+        for variant in ('pandas', 'streaming'):
+            result = subprocess.run(
+                [sys.executable, __file__, '--export-variant', variant, tmp],
+                capture_output=True, text=True, check=True
+            )
+            elapsed, peak_mb, size = result.stdout.split()
+            rows.append((f'{variant} ({EXPORT_ROWS} rows)', f'{float(elapsed):7.2f} s  peak RSS {float(peak_mb):8.1f} MB  {int(size) // 1024} KB'))
+    report('excel_export', rows)
+
+@benchmark
+def export_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        make_fixture(tmp, students=2000, reports=50000)
+        app.config['EXPORT_CACHE_DIR'] = os.path.join(tmp, 'export-cache')
+        c = client('admin')
+        timings = []
+        for label, headers in (('cold', {}), ('cached', {}), ('cached', {}), ('304', None)):
+            if headers is None:
+                headers = {'If-None-Match': etag}
+            start = time.perf_counter()
+            response = c.get('/export', headers=headers)
+            response.get_data()
+            timings.append((f'{label} ({response.status_code})', f'{(time.perf_counter() - start) * 1000:8.1f} ms'))
+            etag = response.headers['ETag'].strip('"')
+        report('export_cache', timings)
+
+# Cold start: a fresh interpreter importing app.py and running init_db, as a
+# worker does on boot or autoreload. Flask is imported first so its own
+# import time, which the app cannot change, is left out of the figures.
+# Modules that must only load on the routes that use them are listed in
+# LAZY_MODULES; tests/test_startup.py holds the budget.
+LAZY_MODULES = ('pandas', 'xlsxwriter', 'pyarrow', 'tkinter')
+
+COLD_START = '''
+import os, sys, tempfile, time
+import flask
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+with tempfile.TemporaryDirectory() as tmp:
+    app.app.config['SCHOOL_DB'] = os.path.join(tmp, 'school.db')
+    app.app.config['CREDENTIAL_DB'] = os.path.join(tmp, 'credential.db')
+    with app.app.app_context():
+        app.init_db()
+    print((imported - start) * 1000, (time.perf_counter() - imported) * 1000)
+'''
+
+def import_times(stderr):
+    # Parses `python -X importtime` output into {module: (cumulative us, indent)},
+    # in the order the imports finished.
+    times = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(cumulative), len(name) - len(name.lstrip()))
+    return times
+
+def cold_start():
+    # Returns (import app ms, init_db ms, import_times) from a fresh interpreter.
+    here = os.path.dirname(os.path.abspath(__file__))
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', COLD_START],
+        cwd=here, capture_output=True, text=True, check=True
+    )
+    import_ms, init_ms = map(float, result.stdout.split())
+    return import_ms, init_ms, import_times(result.stderr)
+
+@benchmark
+def startup(runs=5):
+    samples = [cold_start() for _ in range(runs)]
+    import_ms, init_ms, times = sorted(samples, key=lambda sample: sample[0] + sample[1])[len(samples) // 2]
+    # importtime lists a module after everything it imports, indenting each
+    # nesting level by two spaces; the run just before app, one level deeper,
+    # is what app.py itself pulls in.
+    names = list(times)
+    depth = times['app'][1] + 2
+    children = []
+    for name in reversed(names[:names.index('app')]):
+        us, indent = times[name]
+        if indent < depth:
+            break
+        if indent == depth:
+            children.append((us, name))
+    top = sorted(children, reverse=True)[:8]
+    rows = [(f'import app + init_db (median of {runs})', f'{import_ms + init_ms:8.1f} ms')]
+    rows.append(('import app', f'{import_ms:8.1f} ms'))
+    rows += [(f'  {name}', f'{us / 1000:8.1f} ms') for us, name in top]
+    rows.append(('init_db', f'{init_ms:8.1f} ms'))
+    eager = [name for name in LAZY_MODULES if name in times]
+    if eager:
+        rows.append(('eagerly imported', ', '.join(eager)))
+    report('startup', rows)
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--export-variant']:
+        export_variant(*sys.argv[2:4])
+        sys.exit()
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        BENCHMARKS[name]()
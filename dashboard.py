@@ -1,22 +1,14 @@
-from flask import Blueprint, session, redirect, send_file, request, current_app, render_template_string, flash
-import pandas as pd
-import io
+from flask import Blueprint, session, redirect, send_file, request, current_app, render_template, flash, Response, stream_with_context, jsonify
+import export
+import jobs
 from werkzeug.security import check_password_hash, generate_password_hash
+from database import get_db, get_cred_db, fts_query, name_filter, stat, stat_keys
+from listing import paginate, sort_link, pager
+import directory
+import invoices
 
 dashboard_bp = Blueprint('dashboard', __name__)
 
-def get_db():
-    import sqlite3
-    conn = sqlite3.connect('school.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_cred_db():
-    import sqlite3
-    conn = sqlite3.connect('credential.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 def is_hashed(password):
     return isinstance(password, str) and password.startswith(("pbkdf2:", "scrypt:", "argon2:"))
 
@@ -37,11 +29,9 @@ def admin_dashboard():
     if not session.get('admin_logged_in'):
         return redirect('/admin-login')
     db = get_db()
-    cred_db = get_cred_db()
-    teachers = list(cred_db.execute('SELECT id, username FROM teachers'))
-    classes = list(db.execute('SELECT DISTINCT class FROM reports'))
-    student_classes = list(db.execute('SELECT DISTINCT class FROM students'))
-    staff_count = cred_db.execute('SELECT COUNT(*) FROM staffs').fetchone()[0]
+    teachers = directory.entries('teachers')
+    classes = stat_keys(db, 'reports.class')
+    student_classes = stat_keys(db, 'students.class')
 
     report_teacher = None
     report_class = None
@@ -49,337 +39,382 @@ def admin_dashboard():
     student_teacher = None
     student_class = None
     student_name = None
-    if request.method == 'POST':
-        filter_type = request.form.get('filter_type')
-        if filter_type == 'reports':
-            report_teacher = request.form.get('teacher')
-            report_class = request.form.get('class')
-            report_student = request.form.get('student_name')
-        elif filter_type == 'students':
-            student_teacher = request.form.get('teacher')
-            student_class = request.form.get('class')
-            student_name = request.form.get('student_name')
-
-    # Build teacher dictionary for fast lookup
-    teacher_dict = {t['id']: t['username'] for t in teachers}
+    # Filters arrive by POST from the filter forms and by GET from the
+    # pagination links, which carry them along
+    filter_type = request.values.get('filter_type')
+    if filter_type == 'reports':
+        report_teacher = request.values.get('teacher')
+        report_class = request.values.get('class')
+        report_student = request.values.get('student_name')
+    elif filter_type == 'students':
+        student_teacher = request.values.get('teacher')
+        student_class = request.values.get('class')
+        student_name = request.values.get('student_name')
 
-    # Build the reports query with filters
-    query = 'SELECT * FROM reports'
+    # Build the reports query with filters; teacher names come from the
+    # attached credential database
     params = []
     filters = []
     if report_teacher:
-        filters.append('teacher_id=?')
+        filters.append('reports.teacher_id=?')
         params.append(report_teacher)
     if report_class:
-        filters.append('class=?')
+        filters.append('reports.class=?')
         params.append(report_class)
     if report_student:
-        filters.append('student_name LIKE ?')
-        params.append(f"%{report_student}%")
-    if filters:
-        query += ' WHERE ' + ' AND '.join(filters)
-    query += ' ORDER BY id DESC'
+        filters.append(name_filter('reports'))
+        params.append(fts_query(report_student))
+    reports = paginate(
+        db,
+        "reports.*, COALESCE(t.username, 'Unknown') AS teacher_name",
+        'reports LEFT JOIN cred.teachers AS t ON t.id = reports.teacher_id',
+        'reports.id', {'id': 'reports.id', 'class': "IFNULL(reports.class, '')"},
+        filters, params, prefix='r_'
+    )
 
-    reports = db.execute(query, params).fetchall()
-    student_query = 'SELECT * FROM students'
     student_params = []
     student_filters = []
     if student_teacher:
-        student_filters.append('teacher_id=?')
+        student_filters.append('students.teacher_id=?')
         student_params.append(student_teacher)
     if student_class:
-        student_filters.append('class=?')
+        student_filters.append('students.class=?')
         student_params.append(student_class)
     if student_name:
-        student_filters.append('name LIKE ?')
-        student_params.append(f"%{student_name}%")
-    if student_filters:
-        student_query += ' WHERE ' + ' AND '.join(student_filters)
-    student_query += ' ORDER BY id DESC'
-    students = db.execute(student_query, student_params).fetchall()
-
-    html = '''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Admin Dashboard</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <!-- Sidebar -->
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin" class="active">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices">Invoices</a>
-          <a href="/admin/teachers">Teachers</a>
-          <a href="/admin/staffs">Staffs</a>
-          <a href="/admin/students">Students</a>
-          {clear_db_link}
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <!-- Main -->
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="topbar">
-            <div class="left">
-              <h3 style="margin:0;">Project overview</h3>
-            </div>
-            <div style="display:flex; gap:10px; align-items:center;">
-              <input class="form-control search" placeholder="Search" />
-            </div>
-          </div>
+        student_filters.append(name_filter('students'))
+        student_params.append(fts_query(student_name))
+    students = paginate(
+        db,
+        "students.*, COALESCE(t.username, 'Unknown') AS teacher_name",
+        'students LEFT JOIN cred.teachers AS t ON t.id = students.teacher_id',
+        'students.id', {'id': 'students.id', 'class': 'students.class', 'name': 'students.name'},
+        student_filters, student_params, prefix='s_'
+    )
 
-          <!-- Summary cards row -->
-          <div class="row mb-4">
-            <div class="col-md-2 col-6 mb-3">
-              <div class="card">
-                <div class="card-body text-center">
-                  <div class="stat">Students</div>
-                  <div class="stat-value">{student_count}</div>
-                </div>
+    # Stream the page chunk by chunk instead of concatenating one large string
+    def generate():
+        yield '''
+        <!DOCTYPE html>
+        <html lang="en">
+        <head>
+            <title>Admin Dashboard</title>
+            <meta name="viewport" content="width=device-width, initial-scale=1">
+            <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
+            <link rel="stylesheet" href="/static/dashboard.css">
+        </head>
+        <body>
+        <div class="container-fluid">
+          <div class="row">
+            <!-- Sidebar -->
+            <nav class="col-12 col-md-2 sidebar d-flex flex-column">
+              <div class="brand">LearnWell</div>
+              <a href="/admin" class="active">Dashboards</a>
+              <a href="/export">Export</a>
+              <a href="/export?mode=full">Export All</a>
+              <a href="/admin/add-user">Add User</a>
+              <a href="/admin/invoices">Invoices</a>
+              <a href="/admin/teachers">Teachers</a>
+              <a href="/admin/staffs">Staffs</a>
+              <a href="/admin/students">Students</a>
+              {clear_db_link}
+              <div class="mt-auto">
+                <a href="/admin-logout" class="logout">Logout</a>
               </div>
-            </div>
-            <div class="col-md-2 col-6 mb-3">
-              <div class="card">
-                <div class="card-body text-center">
-                  <div class="stat">Teachers</div>
-                  <div class="stat-value">{teacher_count}</div>
+            </nav>
+            <!-- Main -->
+            <main class="col-12 col-md-10 ms-sm-auto px-4">
+              <div class="topbar">
+                <div class="left">
+                  <h3 style="margin:0;">Project overview</h3>
                 </div>
-              </div>
-            </div>
-            <div class="col-md-2 col-6 mb-3">
-              <div class="card">
-                <div class="card-body text-center">
-                  <div class="stat">Staff</div>
-                  <div class="stat-value">{staff_count}</div>
-                </div>
-              </div>
-            </div>
-            <div class="col-md-2 col-6 mb-3">
-              <div class="card">
-                <div class="card-body text-center">
-                  <div class="stat">Classes</div>
-                  <div class="stat-value">{class_count}</div>
-                </div>
-              </div>
-            </div>
-            <div class="col-md-2 col-6 mb-3">
-              <div class="card">
-                <div class="card-body text-center">
-                  <div class="stat">Reports</div>
-                  <div class="stat-value">{report_count}</div>
+                <div style="display:flex; gap:10px; align-items:center;">
+                  <input class="form-control search" placeholder="Search" />
                 </div>
               </div>
-            </div>
-          </div>
-
-          <!-- Reports Table -->
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <h5 class="card-title">Reports Table</h5>
-              <form method="post" class="row g-3 mb-3" data-auto-submit="true">
-                <input type="hidden" name="filter_type" value="reports">
-                <div class="col-md-4">
-                  <label class="form-label">View Teacher</label>
-                  <select name="teacher" class="form-select">
-                    <option value="">All</option>
-    '''.format(
-        student_count=db.execute('SELECT COUNT(*) FROM students').fetchone()[0],
-        teacher_count=len(teachers),
-        staff_count=cred_db.execute('SELECT COUNT(*) FROM staffs').fetchone()[0],
-        class_count=len(classes),
-        report_count=db.execute('SELECT COUNT(*) FROM reports').fetchone()[0],
-        clear_db_link=('<a href="/admin/clear-database-confirm" class="clear-db">Clear Database</a>' if current_app.debug else '')
-    )
 
-    for t in teachers:
-        sel = 'selected' if report_teacher and str(t['id']) == str(report_teacher) else ''
-        html += f'<option value="{t["id"]}" {sel}>{t["username"]}</option>'
-    html += f'''
-                  </select>
+              <!-- Summary cards row -->
+              <div class="row mb-4">
+                <div class="col-md-2 col-6 mb-3">
+                  <div class="card">
+                    <div class="card-body text-center">
+                      <div class="stat">Students</div>
+                      <div class="stat-value">{student_count}</div>
+                    </div>
+                  </div>
                 </div>
-                <div class="col-md-4">
-                  <label class="form-label">View by Class</label>
-                  <select name="class" class="form-select">
-                    <option value="">All</option>
-    '''
-    for c in classes:
-        sel = 'selected' if report_class and c['class'] == report_class else ''
-        html += f'<option value="{c["class"]}" {sel}>{c["class"]}</option>'
-    html += f'''
-                  </select>
+                <div class="col-md-2 col-6 mb-3">
+                  <div class="card">
+                    <div class="card-body text-center">
+                      <div class="stat">Teachers</div>
+                      <div class="stat-value">{teacher_count}</div>
+                    </div>
+                  </div>
                 </div>
-                <div class="col-md-4">
-                  <label class="form-label">Student Name</label>
-                  <input name="student_name" class="form-control" placeholder="Search by name" value="{report_student or ''}">
+                <div class="col-md-2 col-6 mb-3">
+                  <div class="card">
+                    <div class="card-body text-center">
+                      <div class="stat">Staff</div>
+                      <div class="stat-value">{staff_count}</div>
+                    </div>
+                  </div>
                 </div>
-                <div class="col-12">
-                  <button type="submit" class="btn btn-primary">Filter</button>
+                <div class="col-md-2 col-6 mb-3">
+                  <div class="card">
+                    <div class="card-body text-center">
+                      <div class="stat">Classes</div>
+                      <div class="stat-value">{class_count}</div>
+                    </div>
+                  </div>
                 </div>
-              </form>
-              <div class="table-responsive">
-                <table class="table align-middle table-hover">
-                  <thead>
-                    <tr>
-                      <th>Teacher</th>
-                      <th>Class</th>
-                      <th>Grade</th>
-                      <th>Student Name</th>
-                      <th>Score</th>
-                      <th>Comment</th>
-                    </tr>
-                  </thead>
-                  <tbody>
+                <div class="col-md-2 col-6 mb-3">
+                  <div class="card">
+                    <div class="card-body text-center">
+                      <div class="stat">Reports</div>
+                      <div class="stat-value">{report_count}</div>
+                    </div>
+                  </div>
+                </div>
+              </div>
+
+              <!-- Reports Table -->
+              <div class="card shadow-sm">
+                <div class="card-body">
+                  <h5 class="card-title">Reports Table</h5>
+                  <form method="post" action="/admin" class="row g-3 mb-3" data-auto-submit="true">
+                    <input type="hidden" name="filter_type" value="reports">
+                    <div class="col-md-4">
+                      <label class="form-label">View Teacher</label>
+                      <select name="teacher" class="form-select">
+                        <option value="">All</option>
+        '''.format(
+            student_count=stat(db, 'students'),
+            teacher_count=stat(db, 'teachers', schema='cred'),
+            staff_count=stat(db, 'staffs', schema='cred'),
+            class_count=len(classes),
+            report_count=stat(db, 'reports'),
+            clear_db_link=('<a href="/admin/clear-database-confirm" class="clear-db">Clear Database</a>' if current_app.debug else '')
+        )
+
+        for t in teachers:
+            sel = 'selected' if report_teacher and str(t['id']) == str(report_teacher) else ''
+            yield f'<option value="{t["id"]}" {sel}>{t["username"]}</option>'
+        yield f'''
+                      </select>
+                    </div>
+                    <div class="col-md-4">
+                      <label class="form-label">View by Class</label>
+                      <select name="class" class="form-select">
+                        <option value="">All</option>
         '''
-    for row in reports:
-        teacher_name = teacher_dict.get(row["teacher_id"], "Unknown")
-        html += f'''
-        <tr>
-            <td>{teacher_name}</td>
-            <td>{row["class"]}</td>
-            <td>{row["grade"]}</td>
-            <td>{row["student_name"]}</td>
-            <td>{row["student_score"]}</td>
-            <td>{row["teacher_comment"]}</td>
-        </tr>
+        for c in classes:
+            sel = 'selected' if report_class and c == report_class else ''
+            yield f'<option value="{c}" {sel}>{c}</option>'
+        yield f'''
+                      </select>
+                    </div>
+                    <div class="col-md-4">
+                      <label class="form-label">Student Name</label>
+                      <input name="student_name" class="form-control" placeholder="Search by name" value="{report_student or ''}">
+                    </div>
+                    <div class="col-12">
+                      <button type="submit" class="btn btn-primary">Filter</button>
+                    </div>
+                  </form>
+                  <div class="table-responsive">
+                    <table class="table align-middle table-hover">
+                      <thead>
+                        <tr>
+                          <th>Teacher</th>
+                          <th>{sort_link(reports, 'class', 'Class')}</th>
+                          <th>Grade</th>
+                          <th>Student Name</th>
+                          <th>Score</th>
+                          <th>Comment</th>
+                        </tr>
+                      </thead>
+                      <tbody>
+            '''
+        for row in reports:
+            yield f'''
+            <tr>
+                <td>{row["teacher_name"]}</td>
+                <td>{row["class"]}</td>
+                <td>{row["grade"]}</td>
+                <td>{row["student_name"]}</td>
+                <td>{row["student_score"]}</td>
+                <td>{row["teacher_comment"]}</td>
+            </tr>
+            '''
+        yield '''
+                      </tbody>
+                    </table>
+                  </div>
         '''
-    html += '''
-                  </tbody>
-                </table>
-              </div>
-            </div>
-          </div>
-          <div class="card shadow-sm mt-4">
-            <div class="card-body">
-              <h5 class="card-title">Student Data Table</h5>
-              <form method="post" class="row g-3 mb-3" data-auto-submit="true">
-                <input type="hidden" name="filter_type" value="students">
-                <div class="col-md-4">
-                  <label class="form-label">View Teacher</label>
-                  <select name="teacher" class="form-select">
-                    <option value="">All</option>
-    '''
-    for t in teachers:
-        sel = 'selected' if student_teacher and str(t['id']) == str(student_teacher) else ''
-        html += f'<option value="{t["id"]}" {sel}>{t["username"]}</option>'
-    html += '''
-                  </select>
+        yield pager(reports)
+        yield '''
                 </div>
-                <div class="col-md-4">
-                  <label class="form-label">View by Class</label>
-                  <select name="class" class="form-select">
-                    <option value="">All</option>
-    '''
-    for c in student_classes:
-        sel = 'selected' if student_class and c['class'] == student_class else ''
-        html += f'<option value="{c["class"]}" {sel}>{c["class"]}</option>'
-    html += f'''
-                  </select>
-                </div>
-                <div class="col-md-4">
-                  <label class="form-label">Student Name</label>
-                  <input name="student_name" class="form-control" placeholder="Search by name" value="{student_name or ''}">
-                </div>
-                <div class="col-12">
-                  <button type="submit" class="btn btn-primary">Filter</button>
-                </div>
-              </form>
-              <div class="table-responsive">
-                <table class="table align-middle table-hover">
-                  <thead>
-                    <tr>
-                      <th>Name</th>
-                      <th>Class</th>
-                      <th>Grade</th>
-                      <th>Teacher</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-    '''
-    for row in students:
-        teacher_name = teacher_dict.get(row["teacher_id"], "Unknown")
-        html += f'''
-        <tr>
-            <td>{row["name"]}</td>
-            <td>{row["class"]}</td>
-            <td>{row["grade"]}</td>
-            <td>{teacher_name}</td>
-        </tr>
+              </div>
+              <div class="card shadow-sm mt-4">
+                <div class="card-body">
+                  <h5 class="card-title">Student Data Table</h5>
+                  <form method="post" action="/admin" class="row g-3 mb-3" data-auto-submit="true">
+                    <input type="hidden" name="filter_type" value="students">
+                    <div class="col-md-4">
+                      <label class="form-label">View Teacher</label>
+                      <select name="teacher" class="form-select">
+                        <option value="">All</option>
+        '''
+        for t in teachers:
+            sel = 'selected' if student_teacher and str(t['id']) == str(student_teacher) else ''
+            yield f'<option value="{t["id"]}" {sel}>{t["username"]}</option>'
+        yield '''
+                      </select>
+                    </div>
+                    <div class="col-md-4">
+                      <label class="form-label">View by Class</label>
+                      <select name="class" class="form-select">
+                        <option value="">All</option>
         '''
-    html += '''
-                  </tbody>
-                </table>
+        for c in student_classes:
+            sel = 'selected' if student_class and c == student_class else ''
+            yield f'<option value="{c}" {sel}>{c}</option>'
+        yield f'''
+                      </select>
+                    </div>
+                    <div class="col-md-4">
+                      <label class="form-label">Student Name</label>
+                      <input name="student_name" class="form-control" placeholder="Search by name" value="{student_name or ''}">
+                    </div>
+                    <div class="col-12">
+                      <button type="submit" class="btn btn-primary">Filter</button>
+                    </div>
+                  </form>
+                  <div class="table-responsive">
+                    <table class="table align-middle table-hover">
+                      <thead>
+                        <tr>
+                          <th>{sort_link(students, 'name', 'Name')}</th>
+                          <th>{sort_link(students, 'class', 'Class')}</th>
+                          <th>Grade</th>
+                          <th>Teacher</th>
+                        </tr>
+                      </thead>
+                      <tbody>
+        '''
+        for row in students:
+            yield f'''
+            <tr>
+                <td>{row["name"]}</td>
+                <td>{row["class"]}</td>
+                <td>{row["grade"]}</td>
+                <td>{row["teacher_name"]}</td>
+            </tr>
+            '''
+        yield '''
+                      </tbody>
+                    </table>
+                  </div>
+        '''
+        yield pager(students)
+        yield '''
+                </div>
               </div>
-            </div>
+            </main>
           </div>
-        </main>
-      </div>
-    </div>
-    <script>
-      (function () {
-        var forms = document.querySelectorAll('form[data-auto-submit="true"]');
-        forms.forEach(function (form) {
-          var timeoutId;
-          var inputs = form.querySelectorAll('input[type="text"], input[type="search"]');
-          inputs.forEach(function (input) {
-            input.addEventListener('input', function () {
-              clearTimeout(timeoutId);
-              timeoutId = setTimeout(function () {
-                form.submit();
-              }, 400);
-            });
-          });
-          var selects = form.querySelectorAll('select');
-          selects.forEach(function (select) {
-            select.addEventListener('change', function () {
-              form.submit();
+        </div>
+        <script>
+          (function () {
+            var forms = document.querySelectorAll('form[data-auto-submit="true"]');
+            forms.forEach(function (form) {
+              var timeoutId;
+              var inputs = form.querySelectorAll('input[type="text"], input[type="search"]');
+              inputs.forEach(function (input) {
+                input.addEventListener('input', function () {
+                  clearTimeout(timeoutId);
+                  timeoutId = setTimeout(function () {
+                    form.submit();
+                  }, 400);
+                });
+              });
+              var selects = form.querySelectorAll('select');
+              selects.forEach(function (select) {
+                select.addEventListener('change', function () {
+                  form.submit();
+                });
+              });
             });
-          });
-        });
-      })();
-    </script>
-    </body>
-    </html>
-    '''
-    return html
+          })();
+        </script>
+        </body>
+        </html>
+        '''
+    return Response(stream_with_context(generate()))
 
 @dashboard_bp.route('/export')
 def export_excel():
+    if not session.get('admin_logged_in'):
+        return redirect('/admin-login')
     db = get_db()
-    cred_db = get_cred_db()
-    teachers = {row['id']: row['username'] for row in cred_db.execute('SELECT id, username FROM teachers')}
 
     # Get filters from session
     selected_teacher = session.get('admin_filter_teacher')
     selected_class = session.get('admin_filter_class')
 
-    query = 'SELECT * FROM reports'
-    params = []
-    filters = []
-    if selected_teacher:
-        filters.append('teacher_id=?')
-        params.append(selected_teacher)
-    if selected_class:
-        filters.append('class=?')
-        params.append(selected_class)
-    if filters:
-        query += ' WHERE ' + ' AND '.join(filters)
+    # ?mode=full exports students, reports, payments and invoices as one workbook
+    if request.args.get('mode') == 'full':
+        return export.xlsx_response(db, 'workbook', "school.xlsx", selected_teacher, selected_class)
+    return export.xlsx_response(db, 'reports', "report.xlsx", selected_teacher, selected_class)
 
-    df = pd.read_sql_query(query, db, params=params)
-    df['teacher'] = df['teacher_id'].map(teachers)
-    df = df[['teacher', 'class', 'grade', 'student_name', 'student_score', 'teacher_comment']]
-    output = io.BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        df.to_excel(writer, index=False)
-    output.seek(0)
-    return send_file(output, download_name="report.xlsx", as_attachment=True)
+@dashboard_bp.route('/export/<table>.<fmt>')
+def export_stream(table, fmt):
+    if not session.get('admin_logged_in'):
+        return redirect('/admin-login')
+    if table not in export.EXPORTS or fmt not in (*export.STREAM_FORMATS, *export.COLUMNAR_FORMATS):
+        return "Unknown export", 404
+    selected_teacher = request.args.get('teacher', session.get('admin_filter_teacher'))
+    selected_class = request.args.get('class', session.get('admin_filter_class'))
+    if fmt in export.COLUMNAR_FORMATS:
+        try:
+            return export.columnar_response(get_db(), table, fmt, selected_teacher, selected_class)
+        except ImportError:
+            return "Parquet/Arrow export requires pyarrow", 501
+    return export.stream_response(get_db(), table, fmt, selected_teacher, selected_class)
+
+@dashboard_bp.route('/export/jobs', methods=['POST'])
+def export_job_create():
+    if not session.get('admin_logged_in'):
+        return redirect('/admin-login')
+    table = request.values.get('table', 'reports')
+    fmt = request.values.get('format', 'xlsx')
+    if table not in export.EXPORTS or fmt not in ('xlsx', *export.STREAM_FORMATS, *export.COLUMNAR_FORMATS):
+        return "Unknown export", 404
+    selected_teacher = request.values.get('teacher', session.get('admin_filter_teacher'))
+    selected_class = request.values.get('class', session.get('admin_filter_class'))
+    job = jobs.submit(table, fmt, selected_teacher, selected_class)
+    if job is None:
+        return "Too many exports in progress, try again later", 503
+    return jsonify({**job.to_dict(), 'status_url': f'/export/jobs/{job.id}'}), 202
+
+@dashboard_bp.route('/export/jobs/<job_id>')
+def export_job_status(job_id):
+    if not session.get('admin_logged_in'):
+        return redirect('/admin-login')
+    job = jobs.get(job_id)
+    if job is None:
+        return "Export not found or expired", 404
+    status = job.to_dict()
+    if job.status == 'done':
+        status['download_url'] = f'/export/jobs/{job.id}/download'
+    return jsonify(status)
+
+@dashboard_bp.route('/export/jobs/<job_id>/download')
+def export_job_download(job_id):
+    if not session.get('admin_logged_in'):
+        return redirect('/admin-login')
+    job = jobs.get(job_id)
+    if job is None or job.status != 'done':
+        return "Export not found or expired", 404
+    return send_file(job.path, mimetype=export.mimetype(job.fmt), download_name=job.download_name, as_attachment=True)
 
 @dashboard_bp.route('/admin-logout')
 def admin_logout():
@@ -394,12 +429,15 @@ def clear_database():
     db.execute("DELETE FROM reports")
     db.execute("DELETE FROM students")
     db.execute("DELETE FROM payments")
+    db.execute("DELETE FROM payment_ledger")
+    db.execute("DELETE FROM payment_summary")
     db.commit()
     cred_db = get_cred_db()
     cred_db.execute("DELETE FROM teachers")
     cred_db.execute("DELETE FROM admins")
     cred_db.execute("DELETE FROM staffs")
     cred_db.commit()
+    directory.invalidate()
     return "Database cleared."
 
 @dashboard_bp.route('/admin/clear-database-confirm', methods=['GET', 'POST'])
@@ -414,67 +452,7 @@ def clear_database_confirm():
             return redirect('/admin/clear-database')
         else:
             flash("Incorrect password. Database NOT cleared.", "danger")
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Confirm Clear Database</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices">Invoices</a>
-          <a href="/admin/teachers">Teachers</a>
-          <a href="/admin/staffs">Staffs</a>
-          <a href="/admin/students">Students</a>
-          <a href="/admin/clear-database-confirm" class="active">Clear Database</a>
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="d-flex justify-content-between flex-wrap flex-md-nowrap align-items-center pt-3 pb-2 mb-3 border-bottom">
-            <h2>Confirm Clear Database</h2>
-          </div>
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <div class="alert alert-danger">
-                <h4>Are you sure you want to clear the entire database?</h4>
-                <p>This action cannot be undone. Please re-enter your admin password to confirm.</p>
-              </div>
-              <form method="post">
-                <div class="mb-3">
-                  <label for="password" class="form-label">Admin Password</label>
-                  <input type="password" class="form-control" id="password" name="password" required>
-                </div>
-                <button type="submit" class="btn btn-danger">Yes, Clear Database</button>
-                <a href="/admin" class="btn btn-light">Cancel</a>
-              </form>
-              {% with messages = get_flashed_messages(with_categories=true) %}
-                {% if messages %}
-                  <div class="mt-3">
-                    {% for category, message in messages %}
-                      <div class="alert alert-{{ category }}">{{ message }}</div>
-                    {% endfor %}
-                  </div>
-                {% endif %}
-              {% endwith %}
-            </div>
-          </div>
-        </main>
-      </div>
-    </div>
-    </body>
-    </html>
-    ''')
+    return render_template('clear_database_confirm.html')
 @dashboard_bp.route('/admin/invoices')
 def admin_invoices():
     db = get_db()
@@ -485,329 +463,50 @@ def admin_invoices():
         JOIN students ON invoices.student_id = students.id
         ORDER BY invoices.created_at DESC
     ''').fetchall()
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Invoice List</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices" class="active">Invoices</a>
-          <a href="/admin/teachers">Teachers</a>
-          <a href="/admin/staffs">Staffs</a>
-          <a href="/admin/students">Students</a>
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="d-flex justify-content-between flex-wrap flex-md-nowrap align-items-center pt-3 pb-2 mb-3 border-bottom">
-            <h2>Invoice List</h2>
-          </div>
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <div class="table-responsive">
-                <table class="table align-middle table-hover">
-                  <thead>
-                    <tr>
-                      <th>Invoice No</th>
-                      <th>Student Name</th>
-                      <th>Date</th>
-                      <th>View</th>
-                      <th>Download</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                  {% for inv in invoices %}
-                    <tr>
-                      <td>{{ inv['invoice_no'] }}</td>
-                      <td>{{ inv['student_name'] }}</td>
-                      <td>{{ inv['created_at'][:19].replace('T', ' ') }}</td>
-                      <td>
-                        <a href="/admin/view-invoice/{{ inv['id'] }}" class="btn btn-sm btn-info" target="_blank">View</a>
-                      </td>
-                      <td>
-                        <a href="/admin/download-invoice/{{ inv['id'] }}" class="btn btn-sm btn-success">Download</a>
-                      </td>
-                    </tr>
-                  {% endfor %}
-                  </tbody>
-                </table>
-              </div>
-            </div>
-          </div>
-        </main>
-      </div>
-    </div>
-    </body>
-    </html>
-    ''', invoices=invoices)
+    return render_template('admin_invoices.html', invoices=invoices)
 
 @dashboard_bp.route('/admin/view-invoice/<int:invoice_id>')
 def view_invoice(invoice_id):
     db = get_db()
     invoice = db.execute('SELECT * FROM invoices WHERE id=?', (invoice_id,)).fetchone()
-    if not invoice:
+    response = invoices.send(invoice) if invoice else None
+    if response is None:
         return "Invoice not found", 404
-    with open(invoice['file_path'], 'r', encoding='utf-8') as f:
-        html = f.read()
-    return html
+    return response
 
 @dashboard_bp.route('/admin/download-invoice/<int:invoice_id>')
 def download_invoice(invoice_id):
     db = get_db()
     invoice = db.execute('SELECT * FROM invoices WHERE id=?', (invoice_id,)).fetchone()
-    if not invoice:
+    response = invoices.send(invoice, as_attachment=True) if invoice else None
+    if response is None:
         return "Invoice not found", 404
-    return send_file(invoice['file_path'], as_attachment=True)
+    return response
 
 @dashboard_bp.route('/admin/teachers')
 def admin_teachers():
     cred_db = get_cred_db()
-    teachers = cred_db.execute('SELECT id, username, status FROM teachers').fetchall()
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Teacher List</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices">Invoices</a>
-          <a href="/admin/teachers" class="active">Teachers</a>
-          <a href="/admin/staffs">Staffs</a>
-          <a href="/admin/students">Students</a>
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="d-flex justify-content-between flex-wrap flex-md-nowrap align-items-center pt-3 pb-2 mb-3 border-bottom">
-            <h2>Teacher List</h2>
-          </div>
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <div class="table-responsive">
-                <table class="table align-middle table-hover mb-0">
-                  <thead>
-                    <tr>
-                      <th>ID</th>
-                      <th>Username</th>
-                      <th>Status</th>
-                      <th>Actions</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                  {% for t in teachers %}
-                    <tr>
-                      <td>{{ t['id'] }}</td>
-                      <td>{{ t['username'] }}</td>
-                      <td>
-                        {% if t['status'] == 'standby' %}
-                          <span class="badge bg-warning text-dark">Standby</span>
-                        {% else %}
-                          <span class="badge bg-success">Active</span>
-                        {% endif %}
-                      </td>
-                      <td class="d-flex gap-2">
-                        <form method="post" action="/admin/teacher/{{ t['id'] }}/toggle">
-                          <button type="submit" class="btn btn-sm btn-outline-primary">
-                            {% if t['status'] == 'standby' %}Activate{% else %}Standby{% endif %}
-                          </button>
-                        </form>
-                        <form method="post" action="/admin/teacher/{{ t['id'] }}/remove" onsubmit="return confirm('Remove this teacher?');">
-                          <button type="submit" class="btn btn-sm btn-outline-danger">Remove</button>
-                        </form>
-                      </td>
-                    </tr>
-                  {% endfor %}
-                  </tbody>
-                </table>
-              </div>
-              <a href="/admin" class="btn btn-light mt-3">Back to Dashboard</a>
-            </div>
-          </div>
-        </main>
-      </div>
-    </div>
-    </body>
-    </html>
-    ''', teachers=teachers)
+    teachers = paginate(cred_db, 'id, username, status', 'teachers', 'id',
+                        {'id': 'id', 'username': "IFNULL(username, '')"})
+    return render_template('admin_teachers.html', teachers=teachers, sort_link=sort_link, pager=pager)
 
 @dashboard_bp.route('/admin/staffs')
 def admin_staffs():
     cred_db = get_cred_db()
-    staffs = cred_db.execute('SELECT id, username, gender, status FROM staffs').fetchall()
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Staff List</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices">Invoices</a>
-          <a href="/admin/teachers">Teachers</a>
-          <a href="/admin/staffs" class="active">Staffs</a>
-          <a href="/admin/students">Students</a>
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="d-flex justify-content-between flex-wrap flex-md-nowrap align-items-center pt-3 pb-2 mb-3 border-bottom">
-            <h2>Staff List</h2>
-          </div>
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <div class="table-responsive">
-                <table class="table align-middle table-hover mb-0">
-                  <thead>
-                    <tr>
-                      <th>ID</th>
-                      <th>Username</th>
-                      <th>Gender</th>
-                      <th>Status</th>
-                      <th>Actions</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                  {% for s in staffs %}
-                    <tr>
-                      <td>{{ s['id'] }}</td>
-                      <td>{{ s['username'] }}</td>
-                      <td>{{ s['gender'] or '' }}</td>
-                      <td>
-                        {% if s['status'] == 'standby' %}
-                          <span class="badge bg-warning text-dark">Standby</span>
-                        {% else %}
-                          <span class="badge bg-success">Active</span>
-                        {% endif %}
-                      </td>
-                      <td class="d-flex gap-2">
-                        <form method="post" action="/admin/staff/{{ s['id'] }}/toggle">
-                          <button type="submit" class="btn btn-sm btn-outline-primary">
-                            {% if s['status'] == 'standby' %}Activate{% else %}Standby{% endif %}
-                          </button>
-                        </form>
-                        <form method="post" action="/admin/staff/{{ s['id'] }}/remove" onsubmit="return confirm('Remove this staff member?');">
-                          <button type="submit" class="btn btn-sm btn-outline-danger">Remove</button>
-                        </form>
-                      </td>
-                    </tr>
-                  {% endfor %}
-                  </tbody>
-                </table>
-              </div>
-              <a href="/admin" class="btn btn-light mt-3">Back to Dashboard</a>
-            </div>
-          </div>
-        </main>
-      </div>
-    </div>
-    </body>
-    </html>
-    ''', staffs=staffs)
+    staffs = paginate(cred_db, 'id, username, gender, status', 'staffs', 'id',
+                      {'id': 'id', 'username': "IFNULL(username, '')"})
+    return render_template('admin_staffs.html', staffs=staffs, sort_link=sort_link, pager=pager)
 
 @dashboard_bp.route('/admin/students')
 def admin_students():
     db = get_db()
-    students = db.execute('SELECT id, name, class, grade, teacher_id FROM students').fetchall()
-    # Get teacher names for display
-    cred_db = get_cred_db()
-    teachers = {row['id']: row['username'] for row in cred_db.execute('SELECT id, username FROM teachers')}
-    return render_template_string('''
-    <!DOCTYPE html>
-    <html lang="en">
-    <head>
-        <title>Student List</title>
-        <meta name="viewport" content="width=device-width, initial-scale=1">
-        <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
-        <link rel="stylesheet" href="/static/dashboard.css">
-    </head>
-    <body>
-    <div class="container-fluid">
-      <div class="row">
-        <nav class="col-12 col-md-2 sidebar d-flex flex-column">
-          <div class="brand">LearnWell</div>
-          <a href="/admin">Dashboards</a>
-          <a href="/export">Export</a>
-          <a href="/admin/add-user">Add User</a>
-          <a href="/admin/invoices">Invoices</a>
-          <a href="/admin/teachers">Teachers</a>
-          <a href="/admin/staffs">Staffs</a>
-          <a href="/admin/students" class="active">Students</a>
-          <div class="mt-auto">
-            <a href="/admin-logout" class="logout">Logout</a>
-          </div>
-        </nav>
-        <main class="col-12 col-md-10 ms-sm-auto px-4">
-          <div class="d-flex justify-content-between flex-wrap flex-md-nowrap align-items-center pt-3 pb-2 mb-3 border-bottom">
-            <h2>Student List</h2>
-          </div>
-          <div class="card shadow-sm">
-            <div class="card-body">
-              <div class="table-responsive">
-                <table class="table align-middle table-hover mb-0">
-                  <thead>
-                    <tr>
-                      <th>ID</th>
-                      <th>Name</th>
-                      <th>Class</th>
-                      <th>Grade</th>
-                      <th>Teacher</th>
-                    </tr>
-                  </thead>
-                  <tbody>
-                  {% for s in students %}
-                    <tr>
-                      <td>{{ s['id'] }}</td>
-                      <td>{{ s['name'] }}</td>
-                      <td>{{ s['class'] }}</td>
-                      <td>{{ s['grade'] }}</td>
-                      <td>{{ teachers.get(s['teacher_id'], 'Unknown') }}</td>
-                    </tr>
-                  {% endfor %}
-                  </tbody>
-                </table>
-              </div>
-              <a href="/admin" class="btn btn-light mt-3">Back to Dashboard</a>
-            </div>
-          </div>
-        </main>
-      </div>
-    </div>
-    </body>
-    </html>
-    ''', students=students, teachers=teachers)
+    students = paginate(
+        db,
+        "students.id, students.name, students.class, students.grade, COALESCE(t.username, 'Unknown') AS teacher_name",
+        'students LEFT JOIN cred.teachers AS t ON t.id = students.teacher_id',
+        'students.id', {'id': 'students.id', 'name': 'students.name', 'class': 'students.class'}
+    )
+    return render_template('admin_students.html', students=students, sort_link=sort_link, pager=pager)
 
 @dashboard_bp.route('/admin/teacher/<int:teacher_id>/toggle', methods=['POST'])
 def admin_toggle_teacher(teacher_id):
@@ -819,6 +518,7 @@ def admin_toggle_teacher(teacher_id):
         new_status = 'active' if teacher['status'] == 'standby' else 'standby'
         cred_db.execute('UPDATE teachers SET status=? WHERE id=?', (new_status, teacher_id))
         cred_db.commit()
+        directory.invalidate('teachers')
     return redirect('/admin/teachers')
 
 @dashboard_bp.route('/admin/teacher/<int:teacher_id>/remove', methods=['POST'])
@@ -828,6 +528,7 @@ def admin_remove_teacher(teacher_id):
     cred_db = get_cred_db()
     cred_db.execute('DELETE FROM teachers WHERE id=?', (teacher_id,))
     cred_db.commit()
+    directory.invalidate('teachers')
     db = get_db()
     db.execute('UPDATE students SET teacher_id=NULL WHERE teacher_id=?', (teacher_id,))
     db.commit()
@@ -843,6 +544,7 @@ def admin_toggle_staff(staff_id):
         new_status = 'active' if staff['status'] == 'standby' else 'standby'
         cred_db.execute('UPDATE staffs SET status=? WHERE id=?', (new_status, staff_id))
         cred_db.commit()
+        directory.invalidate('staffs')
     return redirect('/admin/staffs')
 
 @dashboard_bp.route('/admin/staff/<int:staff_id>/remove', methods=['POST'])
@@ -852,4 +554,5 @@ def admin_remove_staff(staff_id):
     cred_db = get_cred_db()
     cred_db.execute('DELETE FROM staffs WHERE id=?', (staff_id,))
     cred_db.commit()
+    directory.invalidate('staffs')
     return redirect('/admin/staffs')
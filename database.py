@@ -0,0 +1,263 @@
+import sqlite3
+import threading
+import queue
+from contextlib import contextmanager
+from flask import g, current_app, has_app_context
+
+# --- Connection settings ---
+
+DEFAULTS = {
+    'SCHOOL_DB': 'school.db',
+    'CREDENTIAL_DB': 'credential.db',
+    # Idle connections kept per database file; 0 disables pooling.
+    'DB_POOL_SIZE': 8,
+    # With INVOICE_STORE = 'db', compressed invoice bodies go in this file,
+    # attached as schema "archive"; None keeps them in school.db.
+    'INVOICE_ARCHIVE_DB': None,
+    # Applied to every new connection, in order. WAL lets dashboard readers
+    # run while a teacher or staff member is saving.
+    'DB_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'NORMAL',
+        'cache_size': -16000,
+        'temp_store': 'MEMORY',
+        'mmap_size': 134217728,
+    },
+}
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+def config(key):
+    if has_app_context():
+        return current_app.config.get(key, DEFAULTS[key])
+    return DEFAULTS[key]
+
+def connect(path, pragmas=None, attach=None):
+    # Connections may be handed to a different worker thread on the next
+    # request, but each one is only ever used by a single request at a time.
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    for alias, attached_path in (attach or {}).items():
+        conn.execute('ATTACH DATABASE ? AS ' + alias, (attached_path,))
+    if pragmas is None:
+        pragmas = config('DB_PRAGMAS')
+    for name, value in pragmas.items():
+        conn.execute(f'PRAGMA {name}={value}')
+    return conn
+
+# --- Pool ---
+
+def _pool(path):
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = queue.LifoQueue()
+        return pool
+
+def acquire(path, attach=None):
+    try:
+        return _pool(path).get_nowait()
+    except queue.Empty:
+        return connect(path, attach=attach)
+
+def release(path, conn, pool_size=None):
+    if conn.in_transaction:
+        conn.rollback()
+    if pool_size is None:
+        pool_size = config('DB_POOL_SIZE')
+    pool = _pool(path)
+    if pool.qsize() < pool_size:
+        pool.put(conn)
+    else:
+        conn.close()
+
+def close_pools():
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        while True:
+            try:
+                pool.get_nowait().close()
+            except queue.Empty:
+                break
+
+# --- Request-scoped access ---
+
+def _attachments(key):
+    # credential.db is always attached to school.db connections as schema
+    # "cred": reports, students and invoices are joined to cred.teachers.
+    if key != 'SCHOOL_DB':
+        return None
+    attach = {'cred': config('CREDENTIAL_DB')}
+    if config('INVOICE_ARCHIVE_DB'):
+        attach['archive'] = config('INVOICE_ARCHIVE_DB')
+    return attach
+
+def _get(key):
+    path = config(key)
+    if not has_app_context():
+        return connect(path, attach=_attachments(key))
+    if '_db_conns' not in g:
+        g._db_conns = {}
+    conn = g._db_conns.get(path)
+    if conn is None:
+        conn = g._db_conns[path] = acquire(path, _attachments(key))
+    return conn
+
+def get_db():
+    return _get('SCHOOL_DB')
+
+def get_cred_db():
+    return _get('CREDENTIAL_DB')
+
+def release_all(conns, pool_size=None):
+    for path, conn in conns.items():
+        release(path, conn, pool_size)
+
+def close_db(exc=None):
+    conns = g.pop('_db_conns', None)
+    if conns:
+        release_all(conns)
+
+def hand_over(response):
+    # A streamed body keeps reading after the view returns, but teardown runs
+    # as soon as it does. Give the request's connections to the response
+    # instead, which releases them once the server has closed it. That runs
+    # outside the app context, so the pool size is read now.
+    if response.is_streamed:
+        conns = g.pop('_db_conns', None)
+        if conns:
+            pool_size = config('DB_POOL_SIZE')
+            response.call_on_close(lambda: release_all(conns, pool_size))
+    return response
+
+def init_app(app):
+    for key, value in DEFAULTS.items():
+        app.config.setdefault(key, value)
+    app.after_request(hand_over)
+    app.teardown_appcontext(close_db)
+
+# --- Full-text search ---
+
+# Tables with an FTS5 shadow index on their name column, kept in sync by the
+# triggers created in init_db.
+FTS_TABLES = {
+    'reports': 'student_name',
+    'students': 'name',
+}
+
+def fts_query(text):
+    # Every word becomes a case-insensitive prefix term; all must match.
+    terms = ['"%s"*' % word.replace('"', '""') for word in text.split()]
+    return ' '.join(terms) or '""'
+
+def name_filter(table):
+    return f'{table}.id IN (SELECT rowid FROM {table}_fts WHERE {table}_fts MATCH ?)'
+
+# --- Dashboard statistics ---
+
+# Row counts kept in stat_counts by triggers, so summary cards never count or
+# scan the underlying tables. Each entry is (update columns, [(scope, key)]),
+# where scope and key are SQL expressions over the row ({r} is new or old).
+STAT_GROUPS = {
+    'students': (('class', 'grade', 'teacher_id'), [
+        ("'students'", "''"),
+        ("'students.class'", '{r}.class'),
+        ("'students.grade'", '{r}.grade'),
+        ("'teacher.' || IFNULL({r}.teacher_id, '') || '.students'", "''"),
+        ("'teacher.' || IFNULL({r}.teacher_id, '') || '.class'", '{r}.class'),
+        ("'teacher.' || IFNULL({r}.teacher_id, '') || '.grade'", '{r}.grade'),
+    ]),
+    'reports': (('class',), [
+        ("'reports'", "''"),
+        ("'reports.class'", "IFNULL({r}.class, '')"),
+    ]),
+    'teachers': ((), [("'teachers'", "''")]),
+    'staffs': ((), [("'staffs'", "''")]),
+}
+
+def _stat_bump(table, groups, r, delta):
+    statements = []
+    for scope, key in groups:
+        scope, key = scope.format(r=r), key.format(r=r)
+        if delta > 0:
+            statements.append(f'''
+                INSERT INTO stat_counts (tbl, scope, key, count) VALUES ('{table}', {scope}, {key}, 1)
+                ON CONFLICT(scope, key) DO UPDATE SET count = count + 1;''')
+        else:
+            statements.append(f'''
+                UPDATE stat_counts SET count = count - 1 WHERE scope = {scope} AND key = {key};
+                DELETE FROM stat_counts WHERE scope = {scope} AND key = {key} AND count <= 0;''')
+    return ''.join(statements)
+
+def install_stats(db, table):
+    columns, groups = STAT_GROUPS[table]
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS stat_counts (
+            tbl TEXT NOT NULL,
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    ''')
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name=?", (f'{table}_stats_ai',)).fetchone()
+    db.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_stats_ai AFTER INSERT ON {table} BEGIN'
+               f'{_stat_bump(table, groups, "new", 1)} END')
+    db.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_stats_ad AFTER DELETE ON {table} BEGIN'
+               f'{_stat_bump(table, groups, "old", -1)} END')
+    if columns:
+        db.execute(f'CREATE TRIGGER IF NOT EXISTS {table}_stats_au AFTER UPDATE OF {", ".join(columns)} ON {table} BEGIN'
+                   f'{_stat_bump(table, groups, "old", -1)}{_stat_bump(table, groups, "new", 1)} END')
+    if not exists:
+        db.execute('DELETE FROM stat_counts WHERE tbl=?', (table,))
+        for scope, key in groups:
+            db.execute(f'''
+                INSERT INTO stat_counts (tbl, scope, key, count)
+                SELECT ?, {scope.format(r=table)}, {key.format(r=table)}, COUNT(*) FROM {table} GROUP BY 2, 3
+            ''', (table,))
+
+def stat(db, scope, key='', schema='main'):
+    row = db.execute(f'SELECT count FROM {schema}.stat_counts WHERE scope=? AND key=?', (scope, key)).fetchone()
+    return row[0] if row else 0
+
+def stat_keys(db, scope, schema='main'):
+    return [row[0] for row in db.execute(f'SELECT key FROM {schema}.stat_counts WHERE scope=? ORDER BY key', (scope,))]
+
+# --- Change counters ---
+
+# Every write to a versioned table bumps its row in table_versions, so callers
+# can tell whether anything changed since they last looked (the export cache
+# keys generated files on these numbers).
+
+def install_versioning(db, table):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS table_versions (
+            tbl TEXT PRIMARY KEY,
+            version INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    db.execute('INSERT OR IGNORE INTO table_versions (tbl, version) VALUES (?, 0)', (table,))
+    for suffix, event in (('ai', 'INSERT'), ('au', 'UPDATE'), ('ad', 'DELETE')):
+        db.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_version_{suffix} AFTER {event} ON {table} BEGIN
+                UPDATE table_versions SET version = version + 1 WHERE tbl = '{table}';
+            END
+        ''')
+
+def table_version(db, table, schema='main'):
+    row = db.execute(f'SELECT version FROM {schema}.table_versions WHERE tbl=?', (table,)).fetchone()
+    return row[0] if row else 0
+
+@contextmanager
+def read_snapshot(db):
+    # Runs the enclosed queries in one read transaction so they all see the
+    # same committed state.
+    db.execute('BEGIN')
+    try:
+        yield db
+    finally:
+        db.rollback()
@@ -0,0 +1,80 @@
+import time
+import threading
+from flask import current_app, has_app_context
+import database
+
+# --- Teacher/staff directory cache ---
+#
+# The id/username lists for teachers and staffs change rarely, so they are
+# loaded once per process and reused by every blueprint. A cached list is
+# reloaded when it is older than DIRECTORY_TTL seconds, when a route that
+# edits users calls invalidate(), or when PRAGMA data_version shows that some
+# other connection (another worker, add_user.py) has committed to
+# credential.db since it was loaded.
+
+DEFAULT_TTL = 300
+
+class Directory:
+    def __init__(self, path, table):
+        self.path = path
+        self.table = table
+        self.lock = threading.Lock()
+        self.conn = None
+        self.rows = None
+        self.by_id = {}
+        self.loaded_at = 0.0
+        self.version = None
+
+    def _data_version(self):
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def get(self, ttl):
+        with self.lock:
+            if self.conn is None:
+                self.conn = database.connect(self.path, pragmas={})
+            version = self._data_version()
+            stale = (self.rows is None or version != self.version
+                     or time.monotonic() - self.loaded_at > ttl)
+            if stale:
+                self.rows = self.conn.execute(f'SELECT id, username FROM {self.table} ORDER BY id').fetchall()
+                self.by_id = {row['id']: row['username'] for row in self.rows}
+                self.loaded_at = time.monotonic()
+                self.version = version
+            return self.rows, self.by_id
+
+    def invalidate(self):
+        with self.lock:
+            self.rows = None
+
+_directories = {}
+_directories_lock = threading.Lock()
+
+def _directory(table):
+    key = (database.config('CREDENTIAL_DB'), table)
+    with _directories_lock:
+        directory = _directories.get(key)
+        if directory is None:
+            directory = _directories[key] = Directory(*key)
+        return directory
+
+def _ttl():
+    if has_app_context():
+        return current_app.config.get('DIRECTORY_TTL', DEFAULT_TTL)
+    return DEFAULT_TTL
+
+def entries(table='teachers'):
+    return _directory(table).get(_ttl())[0]
+
+def name(user_id, table='teachers', default='Unknown'):
+    by_id = _directory(table).get(_ttl())[1]
+    try:
+        return by_id.get(int(user_id), default)
+    except (TypeError, ValueError):
+        return default
+
+def invalidate(table=None):
+    with _directories_lock:
+        directories = list(_directories.values())
+    for directory in directories:
+        if table is None or directory.table == table:
+            directory.invalidate()
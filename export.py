@@ -0,0 +1,377 @@
+import os
+import csv
+import uuid
+import time
+import hashlib
+import datetime
+import io
+import json
+import tempfile
+from contextlib import ExitStack
+from flask import send_file, Response, stream_with_context, request, current_app
+import database
+
+# --- Export engine ---
+#
+# Rows are pulled from the SQLite cursor in chunks and written straight to
+# the output, so memory use does not grow with the number of rows exported.
+
+CHUNK_SIZE = 2000
+
+# Exportable tables: output columns, base query, and the columns the
+# teacher and class filters apply to.
+EXPORTS = {
+    'reports': (
+        ['teacher', 'class', 'grade', 'student_name', 'student_score', 'teacher_comment'],
+        '''
+        SELECT t.username AS teacher, reports.class, reports.grade, reports.student_name,
+               reports.student_score, reports.teacher_comment
+        FROM reports LEFT JOIN cred.teachers AS t ON t.id = reports.teacher_id
+        ''',
+        'reports.teacher_id', 'reports.class',
+    ),
+    'students': (
+        ['id', 'name', 'class', 'grade', 'gender', 'dob', 'emergency_contact', 'teacher'],
+        '''
+        SELECT students.id, students.name, students.class, students.grade, students.gender,
+               students.dob, students.emergency_contact, t.username AS teacher
+        FROM students LEFT JOIN cred.teachers AS t ON t.id = students.teacher_id
+        ''',
+        'students.teacher_id', 'students.class',
+    ),
+    'payments': (
+        ['student_id', 'student_name', 'class', 'amount', 'pay_date', 'next_pay_date', 'status', 'discount', 'khr_rate',
+         'discount_usd', 'net_usd', 'net_khr'],
+        '''
+        SELECT revenue.student_id, students.name AS student_name, students.class, revenue.amount,
+               revenue.pay_date, revenue.next_pay_date, revenue.status, revenue.discount, revenue.khr_rate,
+               revenue.discount_usd, revenue.net_usd, revenue.net_khr
+        FROM payment_revenue AS revenue JOIN students ON students.id = revenue.student_id
+        ''',
+        'students.teacher_id', 'students.class',
+    ),
+    'invoices': (
+        ['invoice_no', 'student_id', 'student_name', 'class', 'teacher', 'created_at'],
+        '''
+        SELECT invoices.invoice_no, invoices.student_id, students.name AS student_name, students.class,
+               t.username AS teacher, invoices.created_at
+        FROM invoices JOIN students ON students.id = invoices.student_id
+        LEFT JOIN cred.teachers AS t ON t.id = students.teacher_id
+        ''',
+        'students.teacher_id', 'students.class',
+    ),
+    'ledger': (
+        ['id', 'student_id', 'student_name', 'class', 'kind', 'amount', 'discount', 'khr_rate', 'pay_date', 'recorded_at'],
+        '''
+        SELECT payment_ledger.id, payment_ledger.student_id, students.name AS student_name, students.class,
+               payment_ledger.kind, payment_ledger.amount, payment_ledger.discount, payment_ledger.khr_rate,
+               payment_ledger.pay_date, payment_ledger.recorded_at
+        FROM payment_ledger LEFT JOIN students ON students.id = payment_ledger.student_id
+        ''',
+        'students.teacher_id', 'students.class',
+    ),
+}
+
+# Sheets of the full workbook export, in order.
+WORKBOOK_TABLES = ['students', 'reports', 'payments', 'invoices']
+
+REPORT_COLUMNS = EXPORTS['reports'][0]
+
+# Versioned tables (schema, table) each export reads from.
+EXPORT_SOURCES = {
+    'reports': [('main', 'reports'), ('cred', 'teachers')],
+    'students': [('main', 'students'), ('cred', 'teachers')],
+    'payments': [('main', 'payments'), ('main', 'students'), ('main', 'exchange_rates')],
+    'invoices': [('main', 'invoices'), ('main', 'students'), ('cred', 'teachers')],
+    'ledger': [('main', 'payment_ledger'), ('main', 'students')],
+}
+EXPORT_SOURCES['workbook'] = sorted({source for table in WORKBOOK_TABLES for source in EXPORT_SOURCES[table]})
+
+def export_query(table, teacher=None, class_=None):
+    columns, query, teacher_column, class_column = EXPORTS[table]
+    params = []
+    filters = []
+    if teacher:
+        filters.append(f'{teacher_column}=?')
+        params.append(teacher)
+    if class_:
+        filters.append(f'{class_column}=?')
+        params.append(class_)
+    if filters:
+        query += ' WHERE ' + ' AND '.join(filters)
+    return query, params
+
+def report_query(teacher=None, class_=None):
+    return export_query('reports', teacher, class_)
+
+def iter_rows(cursor, chunk_size=CHUNK_SIZE):
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        yield from rows
+
+def _workbook(out):
+    # xlsxwriter (like pyarrow below) is imported on first use: it adds about
+    # 20 ms to every worker start and only the export routes need it.
+    import xlsxwriter
+    # constant_memory flushes each row to disk as soon as the next one starts
+    return xlsxwriter.Workbook(out, {'constant_memory': True})
+
+def _write_sheet(workbook, sheet_name, cursor, columns):
+    worksheet = workbook.add_worksheet(sheet_name)
+    header = workbook.add_format({'bold': True, 'border': 1, 'align': 'center'})
+    worksheet.write_row(0, 0, columns, header)
+    for row_number, row in enumerate(iter_rows(cursor), start=1):
+        worksheet.write_row(row_number, 0, tuple(row))
+
+def write_xlsx(out, cursor, columns, sheet_name='Sheet1'):
+    workbook = _workbook(out)
+    _write_sheet(workbook, sheet_name, cursor, columns)
+    workbook.close()
+    return out
+
+def write_workbook(out, db, teacher=None, class_=None):
+    # One sheet per table, each filled from its own cursor before the next
+    # sheet starts, so only one sheet's current row is held in memory. Run it
+    # inside database.read_snapshot for a consistent view across sheets.
+    workbook = _workbook(out)
+    for table in WORKBOOK_TABLES:
+        query, params = export_query(table, teacher, class_)
+        _write_sheet(workbook, table.title(), db.execute(query, params), EXPORTS[table][0])
+    workbook.close()
+    return out
+
+def iter_csv(cursor, columns):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if rows:
+            writer.writerows(rows)
+        yield buffer.getvalue()
+        if not rows:
+            break
+        buffer.seek(0)
+        buffer.truncate()
+
+def iter_ndjson(cursor, columns):
+    while True:
+        rows = cursor.fetchmany(CHUNK_SIZE)
+        if not rows:
+            break
+        yield ''.join(json.dumps(dict(zip(columns, row)), ensure_ascii=False) + '\n' for row in rows)
+
+STREAM_FORMATS = {
+    'csv': (iter_csv, 'text/csv'),
+    'ndjson': (iter_ndjson, 'application/x-ndjson'),
+}
+
+def stream_response(db, table, fmt, teacher=None, class_=None):
+    # The ETag and the rows come from one read snapshot, held until the last
+    # chunk has been sent, so a write in between cannot pair the tag with a
+    # different body. An unfinished stream is rolled back when the
+    # connection goes back to the pool.
+    snapshot = ExitStack()
+    snapshot.enter_context(database.read_snapshot(db))
+    etag = export_etag(db, table, fmt, teacher, class_)
+    if etag in request.if_none_match:
+        snapshot.close()
+        return not_modified(etag)
+    query, params = export_query(table, teacher, class_)
+    columns = EXPORTS[table][0]
+    generate, mimetype = STREAM_FORMATS[fmt]
+    rows = db.execute(query, params)
+
+    def body():
+        with snapshot:
+            yield from generate(rows, columns)
+
+    # stream_with_context keeps the request's pooled connection open until
+    # the last chunk has been sent
+    response = Response(
+        stream_with_context(body()),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={table}.{fmt}'},
+    )
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+# --- Columnar export ---
+#
+# Parquet and Arrow IPC files keep column types, so analysts can load them
+# without re-parsing. pyarrow is optional and only imported when one of these
+# formats is requested. Rows are fetched ROW_GROUP_SIZE at a time and each
+# batch becomes one Parquet row group / Arrow record batch.
+
+ROW_GROUP_SIZE = 64 * 1024
+
+COLUMN_TYPES = {
+    'id': 'int', 'student_id': 'int', 'student_score': 'int', 'khr_rate': 'int', 'net_khr': 'int',
+    'amount': 'float', 'discount': 'float', 'discount_usd': 'float', 'net_usd': 'float',
+    'dob': 'date', 'pay_date': 'date', 'next_pay_date': 'date',
+}
+
+def _to_int(value):
+    try:
+        return None if value is None or value == '' else int(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_float(value):
+    try:
+        return None if value is None or value == '' else float(value)
+    except (TypeError, ValueError):
+        return None
+
+def _to_date(value):
+    # Dates are stored as text; anything that is not YYYY-MM-DD becomes null.
+    try:
+        return datetime.date.fromisoformat(str(value)[:10]) if value else None
+    except ValueError:
+        return None
+
+def _to_str(value):
+    return None if value is None else str(value)
+
+CONVERTERS = {'int': _to_int, 'float': _to_float, 'date': _to_date}
+
+def arrow_schema(pa, columns):
+    types = {'int': pa.int64(), 'float': pa.float64(), 'date': pa.date32()}
+    return pa.schema([(column, types.get(COLUMN_TYPES.get(column), pa.string())) for column in columns])
+
+def iter_batches(pa, cursor, schema, size=ROW_GROUP_SIZE):
+    converters = [CONVERTERS.get(COLUMN_TYPES.get(name), _to_str) for name in schema.names]
+    while True:
+        rows = cursor.fetchmany(size)
+        if not rows:
+            break
+        arrays = [
+            pa.array([convert(value) for value in values], type=field.type)
+            for convert, field, values in zip(converters, schema, zip(*rows))
+        ]
+        yield pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+def write_parquet(out, cursor, columns):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema(pa, columns)
+    with pq.ParquetWriter(out, schema, compression='zstd') as writer:
+        for batch in iter_batches(pa, cursor, schema):
+            writer.write_batch(batch)
+    return out
+
+def write_arrow(out, cursor, columns):
+    import pyarrow as pa
+    schema = arrow_schema(pa, columns)
+    with pa.ipc.new_file(out, schema) as writer:
+        for batch in iter_batches(pa, cursor, schema):
+            writer.write_batch(batch)
+    return out
+
+COLUMNAR_FORMATS = {
+    'parquet': (write_parquet, 'application/vnd.apache.parquet'),
+    'arrow': (write_arrow, 'application/vnd.apache.arrow.file'),
+}
+
+def columnar_response(db, table, fmt, teacher=None, class_=None):
+    return cached_response(db, table, fmt, teacher, class_)
+
+XLSX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+def mimetype(fmt):
+    if fmt == 'xlsx':
+        return XLSX_MIMETYPE
+    return (STREAM_FORMATS.get(fmt) or COLUMNAR_FORMATS[fmt])[1]
+
+def write_export(out, cursor, columns, fmt):
+    # Writes any export format to a binary file object.
+    if fmt == 'xlsx':
+        return write_xlsx(out, cursor, columns)
+    if fmt in COLUMNAR_FORMATS:
+        return COLUMNAR_FORMATS[fmt][0](out, cursor, columns)
+    for chunk in STREAM_FORMATS[fmt][0](cursor, columns):
+        out.write(chunk.encode('utf-8'))
+    return out
+
+def xlsx_response(db, table, download_name, teacher=None, class_=None):
+    return cached_response(db, table, 'xlsx', teacher, class_, download_name)
+
+# --- Export cache ---
+#
+# Generated files are kept in EXPORT_CACHE_DIR under a key made of the export
+# parameters and the change counters of every table the export reads, so a
+# repeat request is served from disk (or answered 304 when the client already
+# has it) and any write to those tables produces a new key. Entries unused
+# for EXPORT_CACHE_TTL seconds are removed.
+
+CACHE_DEFAULTS = {
+    'EXPORT_CACHE_DIR': os.path.join(tempfile.gettempdir(), 'school-export-cache'),
+    'EXPORT_CACHE_TTL': 3600,
+}
+
+def _cache_config(key):
+    return current_app.config.get(key, CACHE_DEFAULTS[key])
+
+def export_etag(db, table, fmt, teacher=None, class_=None):
+    versions = [database.table_version(db, name, schema) for schema, name in EXPORT_SOURCES[table]]
+    key = json.dumps([table, fmt, teacher or '', class_ or '', versions])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+def not_modified(etag):
+    response = Response(status=304)
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def prune_cache(directory, ttl):
+    cutoff = time.time() - ttl
+    for entry in os.scandir(directory):
+        try:
+            if entry.stat().st_atime < cutoff and entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+        except OSError:
+            # Already removed by another worker, or still open (Windows)
+            pass
+
+def _write_entry(db, path, table, fmt, teacher, class_):
+    part = f'{path}.{uuid.uuid4().hex}.part'
+    try:
+        with open(part, 'wb') as out:
+            if table == 'workbook':
+                write_workbook(out, db, teacher, class_)
+            else:
+                query, params = export_query(table, teacher, class_)
+                write_export(out, db.execute(query, params), EXPORTS[table][0], fmt)
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+
+def cached_response(db, table, fmt, teacher=None, class_=None, download_name=None):
+    directory = _cache_config('EXPORT_CACHE_DIR')
+    os.makedirs(directory, exist_ok=True)
+    with database.read_snapshot(db):
+        etag = export_etag(db, table, fmt, teacher, class_)
+        if etag in request.if_none_match:
+            return not_modified(etag)
+        path = os.path.join(directory, f'{etag}.{fmt}')
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            prune_cache(directory, _cache_config('EXPORT_CACHE_TTL'))
+            _write_entry(db, path, table, fmt, teacher, class_)
+
+        def send():
+            return send_file(path, mimetype=mimetype(fmt), download_name=download_name or f'{table}.{fmt}',
+                             as_attachment=True, etag=etag)
+
+        try:
+            return send()
+        except FileNotFoundError:
+            # Pruned by another worker that checked it before the utime
+            # above; write it again from the same snapshot.
+            _write_entry(db, path, table, fmt, teacher, class_)
+            return send()
@@ -0,0 +1,393 @@
+import os
+import gzip
+import zlib
+import json
+import zipfile
+import hashlib
+import datetime
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from flask import current_app, request, send_file, Response, stream_with_context
+import database
+import ledger
+
+# --- Stored invoices ---
+#
+# An invoice is rendered once per distinct payment state and written to
+# INVOICE_DIR as <content hash>.html, with a row in the invoices table. The
+# hash covers everything printed on the invoice except its number and date,
+# so reprinting an unchanged payment reuses the stored file and any change to
+# the student, teacher or payment produces a new invoice.
+#
+# With INVOICE_STORE = 'db' the rendered HTML is gzip-compressed into the
+# invoice_bodies table instead (in school.db, or in INVOICE_ARCHIVE_DB when
+# set) and file_path is left empty. Bodies are read back through incremental
+# blob I/O, so serving one never loads the whole invoice into memory.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_DIR = os.path.join(HERE, 'invoices')
+
+STATE_QUERY = '''
+    SELECT students.id AS student_id, students.name, students.class, students.grade,
+           COALESCE(t.username, 'Unknown') AS teacher_name,
+           payments.amount, payments.discount, payments.khr_rate, payments.pay_date,
+           revenue.khr_rate AS rate, revenue.discount_usd, revenue.net_usd, revenue.net_khr
+    FROM students
+    LEFT JOIN cred.teachers AS t ON t.id = students.teacher_id
+    LEFT JOIN payments ON payments.student_id = students.id
+    LEFT JOIN payment_revenue AS revenue ON revenue.id = payments.id
+'''
+
+# Figures ledger.payment_revenue derives from amount, discount and rate; left
+# out of the content hash so invoices stored before they were added keep
+# their hash. rate itself is hashed unless it is just the payment's own
+# khr_rate: without one it comes from exchange_rates, so a rate change must
+# produce a new invoice.
+DERIVED = ('discount_usd', 'net_usd', 'net_khr')
+
+LOOKUP = '''
+    SELECT invoices.*, invoice_bodies.id AS body_id
+    FROM invoices LEFT JOIN invoice_bodies USING (content_hash)
+'''
+
+RECORD = '''
+    INSERT INTO invoices (student_id, invoice_no, file_path, created_at, content_hash) VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(content_hash) DO UPDATE SET file_path=excluded.file_path
+'''
+
+STORE_BODY = '''
+    INSERT INTO invoice_bodies (content_hash, size, body) VALUES (?, ?, ?)
+    ON CONFLICT(content_hash) DO UPDATE SET size=excluded.size, body=excluded.body
+'''
+
+COMPRESS_LEVEL = 9
+CHUNK_SIZE = 64 * 1024
+
+def invoice_dir():
+    return current_app.config.get('INVOICE_DIR', DEFAULT_DIR)
+
+def in_db():
+    return current_app.config.get('INVOICE_STORE', 'files') == 'db'
+
+def install_store(db):
+    schema = 'archive' if database.config('INVOICE_ARCHIVE_DB') else 'main'
+    db.execute(f'''
+        CREATE TABLE IF NOT EXISTS {schema}.invoice_bodies (
+            id INTEGER PRIMARY KEY,
+            content_hash TEXT NOT NULL UNIQUE,
+            size INTEGER NOT NULL,
+            body BLOB NOT NULL
+        )
+    ''')
+
+def state(db, student_id):
+    row = db.execute(STATE_QUERY + ' WHERE students.id=?', (student_id,)).fetchone()
+    return dict(row) if row else None
+
+def content_hash(state):
+    hashed = {key: value for key, value in state.items() if key not in DERIVED}
+    if state['rate'] == state['khr_rate']:
+        del hashed['rate']
+    return hashlib.sha256(json.dumps(hashed, sort_keys=True).encode()).hexdigest()
+
+def context(state, invoice_no, invoice_date):
+    amount = float(state['amount']) if state['amount'] else 0.0
+    discount = float(state['discount']) if state['discount'] is not None else ledger.DEFAULT_DISCOUNT
+    return {
+        'student': state,
+        'teacher_name': state['teacher_name'],
+        'invoice_no': invoice_no,
+        'invoice_date': invoice_date,
+        'amount': amount,
+        'discount': discount,
+        'discount_amount': state['discount_usd'] or 0.0,
+        'total': state['net_usd'] or 0.0,
+        'total_khr': state['net_khr'] or 0,
+        'int': int,
+    }
+
+# Rendering uses its own Jinja environment rather than Flask's so it also
+# works in the batch worker processes, which have no app.
+_environment = None
+
+def render(ctx):
+    global _environment
+    if _environment is None:
+        _environment = Environment(loader=FileSystemLoader(os.path.join(HERE, 'templates')),
+                                   autoescape=select_autoescape(['html']))
+    return _environment.get_template('invoice.html').render(**ctx)
+
+def write(path, html):
+    part = path + '.part'
+    with open(part, 'w', encoding='utf-8') as f:
+        f.write(html)
+    os.replace(part, path)
+
+def render_to(job):
+    path, ctx = job
+    write(path, render(ctx))
+    return path
+
+def compress(job):
+    # Worker counterpart of render_to for the database store.
+    digest, ctx = job
+    html = render(ctx).encode('utf-8')
+    return digest, len(html), gzip.compress(html, COMPRESS_LEVEL, mtime=0)
+
+def _stored(invoice):
+    return invoice['body_id'] is not None or bool(invoice['file_path'] and os.path.exists(invoice['file_path']))
+
+def _plan(current, digest, invoice, now):
+    # Returns the render job and invoices row for a state. Jobs are
+    # (file path, context) for render_to or (digest, context) for compress.
+    invoice_no = invoice['invoice_no'] if invoice else f"Inv-{current['student_id']:04d}-{now.strftime('%Y%m%d%H%M%S')}"
+    invoice_date = current['pay_date'] or now.date().isoformat()
+    path = None if in_db() else os.path.join(invoice_dir(), f'{digest}.html')
+    row = (current['student_id'], invoice_no, path, now.isoformat(timespec='seconds'), digest)
+    return (path or digest, context(current, invoice_no, invoice_date)), row
+
+def get_or_create(db, student_id):
+    # Returns the invoices row for the student's current payment state,
+    # rendering and recording it first if this state has not been seen.
+    current = state(db, student_id)
+    if current is None:
+        return None
+    digest = content_hash(current)
+    invoice = db.execute(LOOKUP + ' WHERE invoices.content_hash=?', (digest,)).fetchone()
+    if invoice and _stored(invoice):
+        return invoice
+
+    job, row = _plan(current, digest, invoice, datetime.datetime.now())
+    if in_db():
+        db.execute(STORE_BODY, compress(job))
+    else:
+        os.makedirs(invoice_dir(), exist_ok=True)
+        render_to(job)
+    db.execute(RECORD, row)
+    db.commit()
+    return db.execute(LOOKUP + ' WHERE invoices.content_hash=?', (digest,)).fetchone()
+
+def send(invoice, as_attachment=False):
+    # Serves a stored invoice with ETag (its content hash), Last-Modified and
+    # Range support, answering 304/206 as appropriate. With USE_X_SENDFILE the
+    # body is left to the front server via X-Sendfile; with
+    # INVOICE_ACCEL_REDIRECT set to the nginx internal location that maps to
+    # INVOICE_DIR, via X-Accel-Redirect. Invoices kept in the database are
+    # streamed from their blob instead. Returns None when the body is missing.
+    path = invoice['file_path']
+    if not path or not os.path.exists(path):
+        return _send_body(invoice, as_attachment)
+    download_name = f"{invoice['invoice_no']}.html"
+    prefix = current_app.config.get('INVOICE_ACCEL_REDIRECT')
+    relative = os.path.relpath(path, invoice_dir())
+    if prefix and not relative.startswith('..'):
+        response = Response(mimetype='text/html')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative.replace(os.sep, '/')
+        if as_attachment:
+            response.headers['Content-Disposition'] = f'attachment; filename="{download_name}"'
+        return response
+    return send_file(path, mimetype='text/html', as_attachment=as_attachment, download_name=download_name,
+                     etag=invoice['content_hash'] or True, conditional=True)
+
+def read_body(db, body_id, compressed=False):
+    # Yields a stored body CHUNK_SIZE bytes at a time, gunzipped unless
+    # compressed is set.
+    schema = 'archive' if database.config('INVOICE_ARCHIVE_DB') else 'main'
+    inflate = None if compressed else zlib.decompressobj(wbits=31)
+    with db.blobopen('invoice_bodies', 'body', body_id, readonly=True, name=schema) as blob:
+        while True:
+            chunk = blob.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            yield inflate.decompress(chunk) if inflate else chunk
+    if inflate:
+        yield inflate.flush()
+
+def _send_body(invoice, as_attachment):
+    # Clients that accept gzip get the stored bytes as they are; others get
+    # them inflated on the fly. Each encoding has its own ETag.
+    db = database.get_db()
+    body = db.execute('SELECT id, size, length(body) AS stored FROM invoice_bodies WHERE content_hash=?',
+                      (invoice['content_hash'],)).fetchone()
+    if body is None:
+        return None
+    compressed = request.accept_encodings['gzip'] > 0
+    response = Response(stream_with_context(read_body(db, body['id'], compressed)), mimetype='text/html')
+    response.content_length = body['stored'] if compressed else body['size']
+    if compressed:
+        response.content_encoding = 'gzip'
+    response.vary.add('Accept-Encoding')
+    response.set_etag(invoice['content_hash'] + ('-gzip' if compressed else ''))
+    if invoice['created_at']:
+        response.last_modified = datetime.datetime.fromisoformat(invoice['created_at'])
+    if as_attachment:
+        response.headers['Content-Disposition'] = f'attachment; filename="{invoice["invoice_no"]}.html"'
+    return response.make_conditional(request)
+
+def delete_for_student(db, student_id):
+    for invoice in db.execute('SELECT file_path FROM invoices WHERE student_id=?', (student_id,)).fetchall():
+        if invoice['file_path'] and os.path.exists(invoice['file_path']):
+            os.remove(invoice['file_path'])
+    db.execute('''
+        DELETE FROM invoice_bodies WHERE content_hash IN (SELECT content_hash FROM invoices WHERE student_id=?)
+    ''', (student_id,))
+    db.execute('DELETE FROM invoices WHERE student_id=?', (student_id,))
+
+# --- Batch generation ---
+#
+# Invoices for many students are rendered on a process pool (INVOICE_WORKERS
+# processes, default one per CPU) and recorded in a single transaction. Small
+# batches render in-process since starting workers would cost more.
+
+PARALLEL_MIN = 16
+LOOKUP_CHUNK = 500
+
+_pool = None
+
+def _workers():
+    global _pool
+    if _pool is None:
+        # Imported here to keep them off the start-up path.
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # spawn rather than fork: the web process has threads (pools, jobs)
+        _pool = ProcessPoolExecutor(max_workers=current_app.config.get('INVOICE_WORKERS') or os.cpu_count(),
+                                    mp_context=multiprocessing.get_context('spawn'))
+    return _pool
+
+def batch_filters(class_=None, grade=None, status=None, month=None):
+    filters = []
+    params = []
+    if class_:
+        filters.append('students.class=?')
+        params.append(class_)
+    if grade:
+        filters.append('students.grade=?')
+        params.append(grade)
+    if status:
+        filters.append('payments.status=?')
+        params.append(status)
+    if month:
+        # month is YYYY-MM; pay_date is ISO so this is a range on the text
+        filters.append("payments.pay_date >= ? AND payments.pay_date < ?")
+        params.extend([f'{month}-01', f'{month}-32'])
+    return filters, params
+
+def generate(db, filters=(), params=()):
+    # Returns [(student name, invoice_no, file_path, content_hash)] for every
+    # matching student, rendering whatever is missing. file_path is None for
+    # invoices kept in the database.
+    query = STATE_QUERY
+    if filters:
+        query += ' WHERE ' + ' AND '.join(filters)
+    states = [dict(row) for row in db.execute(query + ' ORDER BY students.class, students.name', list(params))]
+    digests = [content_hash(current) for current in states]
+    existing = {}
+    for start in range(0, len(digests), LOOKUP_CHUNK):
+        chunk = digests[start:start + LOOKUP_CHUNK]
+        marks = ', '.join('?' * len(chunk))
+        for invoice in db.execute(LOOKUP + f' WHERE invoices.content_hash IN ({marks})', chunk):
+            existing[invoice['content_hash']] = invoice
+
+    store = compress if in_db() else render_to
+    if store is render_to:
+        os.makedirs(invoice_dir(), exist_ok=True)
+    now = datetime.datetime.now()
+    results = []
+    jobs = []
+    rows = []
+    for current, digest in zip(states, digests):
+        invoice = existing.get(digest)
+        if invoice and _stored(invoice):
+            results.append((current['name'], invoice['invoice_no'], invoice['file_path'], digest))
+            continue
+        job, row = _plan(current, digest, invoice, now)
+        jobs.append(job)
+        rows.append(row)
+        results.append((current['name'], row[1], row[2], digest))
+    bodies = None
+    if len(jobs) >= PARALLEL_MIN:
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            bodies = list(_workers().map(store, jobs, chunksize=max(1, len(jobs) // 32)))
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool next time and finish here.
+            current_app.logger.exception('Invoice worker pool failed')
+            global _pool
+            _pool = None
+    if bodies is None:
+        bodies = [store(job) for job in jobs]
+    if store is compress:
+        db.executemany(STORE_BODY, bodies)
+    db.executemany(RECORD, rows)
+    db.commit()
+    return results
+
+# --- Batch output ---
+
+class _Sink:
+    # Write-only file object that hands written bytes to a generator.
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def _read(db, path, digest):
+    # Yields the HTML of one invoice from whichever store holds it.
+    if path and os.path.exists(path):
+        with open(path, 'rb') as f:
+            yield from iter(lambda: f.read(CHUNK_SIZE), b'')
+        return
+    body = db.execute('SELECT id FROM invoice_bodies WHERE content_hash=?', (digest,)).fetchone()
+    if body:
+        yield from read_body(db, body['id'])
+
+def iter_zip(db, results):
+    # The archive is written to an unseekable sink, so zipfile streams each
+    # member with a data descriptor and only one file is held at a time.
+    sink = _Sink()
+    stamp = datetime.datetime.now().timetuple()[:6]
+    with zipfile.ZipFile(sink, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, invoice_no, path, digest in results:
+            info = zipfile.ZipInfo(f'{invoice_no}.html', stamp)
+            info.compress_type = zipfile.ZIP_DEFLATED
+            with archive.open(info, 'w') as member:
+                for chunk in _read(db, path, digest):
+                    member.write(chunk)
+                    yield sink.drain()
+    yield sink.drain()
+
+PRINT_HEAD = '''<!DOCTYPE html>
+<html lang="en">
+<head>
+    <title>Invoices</title>
+    <link href="https://cdn.jsdelivr.net/npm/bootstrap@5.3.2/dist/css/bootstrap.min.css" rel="stylesheet">
+    <style>
+        body { font-family: 'Khmer OS', Arial, sans-serif; }
+        .invoice-box { max-width: 900px; margin: auto; padding: 30px; border: 1px solid #eee; page-break-after: always; }
+        .table th, .table td { vertical-align: middle; }
+        .total-row { font-weight: bold; }
+        @media print { .btn { display: none; } }
+    </style>
+</head>
+<body>
+'''
+
+def iter_html(db, results):
+    # One print-ready page: the body of each stored invoice, one per sheet.
+    yield PRINT_HEAD
+    for name, invoice_no, path, digest in results:
+        html = b''.join(_read(db, path, digest)).decode('utf-8')
+        start = html.find('<body>')
+        end = html.rfind('</body>')
+        yield html[start + len('<body>'):end] if start != -1 and end != -1 else html
+    yield '</body>\n</html>\n'
@@ -0,0 +1,128 @@
+import os
+import time
+import uuid
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+import database
+import export
+
+# --- Background export jobs ---
+#
+# Large exports run on a small thread pool instead of inside the request, so a
+# web worker only spends the time it takes to queue the job. Clients poll the
+# job for progress and download the finished file, which stays on disk until
+# EXPORT_JOB_TTL seconds after it was written. Job state lives in this
+# process; the files live in EXPORT_DIR.
+
+DEFAULTS = {
+    'EXPORT_WORKERS': 2,
+    'EXPORT_MAX_PENDING': 16,
+    'EXPORT_JOB_TTL': 3600,
+    'EXPORT_DIR': os.path.join(tempfile.gettempdir(), 'school-exports'),
+}
+
+class Job:
+    def __init__(self, table, fmt, teacher=None, class_=None):
+        self.id = uuid.uuid4().hex
+        self.table = table
+        self.fmt = fmt
+        self.teacher = teacher
+        self.class_ = class_
+        self.status = 'queued'
+        self.rows = 0
+        self.total = None
+        self.error = None
+        self.path = None
+        self.created_at = time.time()
+        self.finished_at = None
+
+    @property
+    def download_name(self):
+        return f'{self.table}.{self.fmt}'
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'table': self.table,
+            'format': self.fmt,
+            'status': self.status,
+            'rows': self.rows,
+            'total': self.total,
+            'error': self.error,
+        }
+
+class ProgressCursor:
+    # Counts rows as the export writers pull them through fetchmany().
+    def __init__(self, cursor, job):
+        self.cursor = cursor
+        self.job = job
+
+    def fetchmany(self, size):
+        rows = self.cursor.fetchmany(size)
+        self.job.rows += len(rows)
+        return rows
+
+_jobs = {}
+_lock = threading.Lock()
+_executor = None
+
+def _config(key):
+    return current_app.config.get(key, DEFAULTS[key])
+
+def _pool():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=_config('EXPORT_WORKERS'), thread_name_prefix='export')
+    return _executor
+
+def _run(app, job):
+    with app.app_context():
+        job.status = 'running'
+        path = os.path.join(_config('EXPORT_DIR'), f'{job.id}.{job.fmt}')
+        try:
+            db = database.get_db()
+            query, params = export.export_query(job.table, job.teacher, job.class_)
+            job.total = db.execute(f'SELECT COUNT(*) FROM ({query})', params).fetchone()[0]
+            cursor = ProgressCursor(db.execute(query, params), job)
+            with open(path + '.part', 'wb') as out:
+                export.write_export(out, cursor, export.EXPORTS[job.table][0], job.fmt)
+            os.replace(path + '.part', path)
+            job.path = path
+            job.status = 'done'
+        except Exception as e:
+            current_app.logger.exception('Export job %s failed', job.id)
+            job.error = str(e)
+            job.status = 'failed'
+            if os.path.exists(path + '.part'):
+                os.remove(path + '.part')
+        job.finished_at = time.time()
+
+def purge():
+    # Forget finished jobs older than EXPORT_JOB_TTL and delete their files.
+    cutoff = time.time() - _config('EXPORT_JOB_TTL')
+    with _lock:
+        expired = [job for job in _jobs.values() if job.finished_at and job.finished_at < cutoff]
+        for job in expired:
+            del _jobs[job.id]
+    for job in expired:
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+
+def submit(table, fmt, teacher=None, class_=None):
+    # Returns None when EXPORT_MAX_PENDING jobs are already queued or running.
+    purge()
+    os.makedirs(_config('EXPORT_DIR'), exist_ok=True)
+    with _lock:
+        pending = sum(1 for job in _jobs.values() if job.status in ('queued', 'running'))
+        if pending >= _config('EXPORT_MAX_PENDING'):
+            return None
+        job = Job(table, fmt, teacher, class_)
+        _jobs[job.id] = job
+    _pool().submit(_run, current_app._get_current_object(), job)
+    return job
+
+def get(job_id):
+    purge()
+    return _jobs.get(job_id)
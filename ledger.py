@@ -0,0 +1,303 @@
+import datetime
+
+# --- Payment ledger ---
+#
+# payments keeps one editable row per student (the current plan and whether
+# it is paid). Every payment received is also appended to payment_ledger, and
+# payment_summary keeps each student's running totals, so pages and revenue
+# figures read one small row per student instead of replaying history.
+#
+# Both tables are maintained by triggers on payments, so every write path
+# (single save, bulk save, upsert) is covered:
+#   * a row becoming Paid, or a Paid row moving to a new pay_date, appends
+#     an entry for the new payment;
+#   * changing or un-marking a Paid row for the same pay_date appends a
+#     reversal (negative amount) for the old one first.
+# Ledger rows are never updated; corrections are new rows, with kind set to
+# 'reversal' (a zero-amount payment reverses to zero, so the sign alone does
+# not say which is which).
+
+DEFAULT_DISCOUNT = 0.15
+DEFAULT_KHR_RATE = 4100
+
+def _entry(r, sign=''):
+    return (f"{r}.student_id, {sign}CAST(IFNULL({r}.amount, 0) AS REAL), "
+            f"CAST(IFNULL({r}.discount, {DEFAULT_DISCOUNT}) AS REAL), "
+            f"{khr_rate(r)}, {r}.pay_date, '{'reversal' if sign else 'payment'}'")
+
+_CHANGED = ('(new.amount IS NOT old.amount OR new.discount IS NOT old.discount '
+            'OR new.khr_rate IS NOT old.khr_rate)')
+
+def _outstanding(r):
+    return (f"CASE WHEN {r}.status = 'Paid' THEN 0 "
+            f"ELSE IFNULL({r}.amount, 0) * (1 - IFNULL({r}.discount, {DEFAULT_DISCOUNT})) END")
+
+def _last_pay_date(r):
+    # Latest pay_date with more payment entries than reversals. A reversal
+    # carries the pay_date of the entry it cancels.
+    return f'''(SELECT MAX(pay_date) FROM (
+            SELECT pay_date FROM payment_ledger WHERE student_id = {r}.student_id GROUP BY pay_date
+            HAVING SUM(CASE WHEN kind = 'reversal' THEN -1 ELSE 1 END) > 0))'''
+
+def _summary_delta(r, sign):
+    net = f'{r}.amount * (1 - {r}.discount)'
+    # A new payment can only move last_pay_date forward; a reversal or a
+    # deleted entry may take it back, so it is recomputed from the ledger.
+    latest = "NULLIF(MAX(IFNULL(last_pay_date, ''), IFNULL(excluded.last_pay_date, '')), '')"
+    if sign:
+        latest = _last_pay_date(r)
+    else:
+        latest = f"CASE WHEN {r}.kind = 'reversal' THEN {_last_pay_date(r)} ELSE {latest} END"
+    return f'''
+        INSERT INTO payment_summary (student_id, payments, paid_usd, paid_khr, last_pay_date)
+        VALUES ({r}.student_id, {sign}CASE WHEN {r}.kind = 'reversal' THEN -1 ELSE 1 END,
+                {sign}{net}, {sign}CAST(ROUND({net} * {r}.khr_rate) AS INTEGER),
+                CASE WHEN {r}.kind = 'payment' THEN {r}.pay_date END)
+        ON CONFLICT(student_id) DO UPDATE SET
+            payments = payments + excluded.payments,
+            paid_usd = paid_usd + excluded.paid_usd,
+            paid_khr = paid_khr + excluded.paid_khr,
+            last_pay_date = {latest};'''
+
+def install_ledger(db):
+    install_rates(db)
+    exists = db.execute("SELECT 1 FROM sqlite_master WHERE name='payment_ledger'").fetchone()
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS payment_ledger (
+            id INTEGER PRIMARY KEY,
+            student_id INTEGER NOT NULL,
+            amount REAL NOT NULL,
+            discount REAL NOT NULL,
+            khr_rate INTEGER NOT NULL,
+            pay_date TEXT,
+            recorded_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            kind TEXT NOT NULL DEFAULT 'payment' CHECK (kind IN ('payment', 'reversal'))
+        )
+    ''')
+    db.execute('CREATE INDEX IF NOT EXISTS idx_ledger_student ON payment_ledger(student_id, id)')
+    migrate_kind = exists and 'kind' not in [row[1] for row in db.execute('PRAGMA table_info(payment_ledger)')]
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS payment_summary (
+            student_id INTEGER PRIMARY KEY,
+            payments INTEGER NOT NULL DEFAULT 0,
+            paid_usd REAL NOT NULL DEFAULT 0,
+            paid_khr INTEGER NOT NULL DEFAULT 0,
+            last_pay_date TEXT,
+            outstanding_usd REAL NOT NULL DEFAULT 0
+        )
+    ''')
+    if migrate_kind:
+        # Ledgers written before kind existed: negative rows are reversals, as
+        # is a zero row repeating the payment entry just before it (a reversal
+        # always follows the entry it cancels). Payment counts are then
+        # recounted from the entries.
+        db.execute("ALTER TABLE payment_ledger ADD COLUMN kind TEXT NOT NULL DEFAULT 'payment' "
+                   "CHECK (kind IN ('payment', 'reversal'))")
+        db.execute('DROP TRIGGER IF EXISTS payment_ledger_bu')
+        db.execute("UPDATE payment_ledger SET kind = 'reversal' WHERE amount < 0")
+        reversals = []
+        previous = {}
+        for row in db.execute('''
+            SELECT id, student_id, amount, discount, khr_rate, pay_date FROM payment_ledger
+            WHERE student_id IN (SELECT student_id FROM payment_ledger WHERE amount = 0) ORDER BY student_id, id
+        '''):
+            entry = (row[2], row[3], row[4], row[5])
+            last = previous.get(row[1])
+            if row[2] == 0 and last == (entry, 'payment'):
+                reversals.append((row[0],))
+                previous[row[1]] = (entry, 'reversal')
+            else:
+                previous[row[1]] = (entry, 'reversal' if row[2] < 0 else 'payment')
+        db.executemany("UPDATE payment_ledger SET kind = 'reversal' WHERE id = ?", reversals)
+        db.execute('''
+            UPDATE payment_summary SET payments = (
+                SELECT IFNULL(SUM(CASE WHEN kind = 'reversal' THEN -1 ELSE 1 END), 0)
+                FROM payment_ledger WHERE payment_ledger.student_id = payment_summary.student_id)
+        ''')
+    columns = 'student_id, amount, discount, khr_rate, pay_date, kind'
+    triggers = {
+        'payment_ledger_bu': '''BEFORE UPDATE ON payment_ledger BEGIN
+            SELECT RAISE(ABORT, 'payment_ledger is append-only'); END''',
+        'payment_ledger_ai': f'''AFTER INSERT ON payment_ledger BEGIN{_summary_delta('new', '')} END''',
+        'payment_ledger_ad': f'''AFTER DELETE ON payment_ledger BEGIN{_summary_delta('old', '-')} END''',
+        'payments_ledger_ai': f'''AFTER INSERT ON payments WHEN new.status = 'Paid' BEGIN
+            INSERT INTO payment_ledger ({columns}) VALUES ({_entry('new')}); END''',
+        # One trigger so the reversal is always recorded before the new entry.
+        'payments_ledger_au': f'''AFTER UPDATE ON payments BEGIN
+            INSERT INTO payment_ledger ({columns}) SELECT {_entry('old', '-')}
+            WHERE old.status = 'Paid' AND new.pay_date IS old.pay_date
+                  AND (new.status IS NOT 'Paid' OR {_CHANGED});
+            INSERT INTO payment_ledger ({columns}) SELECT {_entry('new')}
+            WHERE new.status = 'Paid'
+                  AND (old.status IS NOT 'Paid' OR new.pay_date IS NOT old.pay_date OR {_CHANGED}); END''',
+        'payments_outstanding_ai': f'''AFTER INSERT ON payments BEGIN
+            INSERT INTO payment_summary (student_id, outstanding_usd) VALUES (new.student_id, {_outstanding('new')})
+            ON CONFLICT(student_id) DO UPDATE SET outstanding_usd = excluded.outstanding_usd; END''',
+        'payments_outstanding_au': f'''AFTER UPDATE ON payments BEGIN
+            INSERT INTO payment_summary (student_id, outstanding_usd) VALUES (new.student_id, {_outstanding('new')})
+            ON CONFLICT(student_id) DO UPDATE SET outstanding_usd = excluded.outstanding_usd; END''',
+        'payments_outstanding_ad': '''AFTER DELETE ON payments BEGIN
+            UPDATE payment_summary SET outstanding_usd = 0 WHERE student_id = old.student_id; END''',
+    }
+    # Recreated on every start so databases pick up changes to the definitions.
+    for name, body in triggers.items():
+        db.execute(f'DROP TRIGGER IF EXISTS {name}')
+        db.execute(f'CREATE TRIGGER {name} {body}')
+    if not exists:
+        # Seed from the payments already on file: one entry per paid row.
+        db.execute(f'''
+            INSERT INTO payment_ledger ({columns})
+            SELECT {_entry('payments')}
+            FROM payments WHERE status = 'Paid' ORDER BY id
+        ''')
+        db.execute(f'''
+            INSERT INTO payment_summary (student_id, outstanding_usd)
+            SELECT student_id, {_outstanding('payments')} FROM payments WHERE true
+            ON CONFLICT(student_id) DO UPDATE SET outstanding_usd = excluded.outstanding_usd
+        ''')
+
+def summaries(db):
+    return {row['student_id']: row for row in db.execute('SELECT * FROM payment_summary')}
+
+def totals(db):
+    return db.execute('''
+        SELECT IFNULL(SUM(payments), 0) AS payments, IFNULL(SUM(paid_usd), 0) AS paid_usd,
+               IFNULL(SUM(paid_khr), 0) AS paid_khr, IFNULL(SUM(outstanding_usd), 0) AS outstanding_usd
+        FROM payment_summary
+    ''').fetchone()
+
+# --- Payment dates ---
+#
+# pay_date and next_pay_date are stored as ISO-8601 (YYYY-MM-DD) text, which
+# sorts and compares correctly, so due/overdue lookups are range scans on
+# idx_payments_next_pay / idx_payments_status.
+
+DATE_FORMATS = ('%Y-%m-%d', '%Y/%m/%d', '%d/%m/%Y', '%d-%m-%Y', '%d %b %Y', '%d %B %Y', '%b %d, %Y', '%B %d, %Y')
+ISO_GLOB = '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'
+
+def iso_date(value):
+    # Returns value as YYYY-MM-DD, or unchanged when it is not a recognisable date.
+    if not value:
+        return value
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            pass
+    try:
+        return datetime.datetime.fromisoformat(text).date().isoformat()
+    except ValueError:
+        return value
+
+def normalize_dates(db):
+    # Rewrites dates saved before they were normalised. Runs before
+    # install_ledger, with the ledger triggers dropped (install_ledger
+    # recreates them), so a reformatted pay_date is not recorded as a new
+    # payment and existing ledger entries can be fixed in place.
+    tables = [row[0] for row in db.execute(
+        "SELECT name FROM sqlite_master WHERE type='table' AND name IN ('payments', 'payment_ledger')")]
+    db.execute('DROP TRIGGER IF EXISTS payments_ledger_au')
+    db.execute('DROP TRIGGER IF EXISTS payment_ledger_bu')
+    for table, columns in (('payments', ('pay_date', 'next_pay_date')), ('payment_ledger', ('pay_date',))):
+        if table not in tables:
+            continue
+        for column in columns:
+            rows = db.execute(f"SELECT id, {column} FROM {table} WHERE {column} NOT GLOB '{ISO_GLOB}'").fetchall()
+            updates = [(iso_date(value), id_) for id_, value in rows if iso_date(value) != value]
+            db.executemany(f'UPDATE {table} SET {column}=? WHERE id=?', updates)
+
+def due(db, until, status=None):
+    # Payments whose next_pay_date is on or before ``until`` (YYYY-MM-DD),
+    # soonest first. Rows without a valid date are left out.
+    query = '''
+        SELECT payments.*, students.name AS student_name, students.class
+        FROM payments JOIN students ON students.id = payments.student_id
+        WHERE payments.next_pay_date BETWEEN '0001-01-01' AND ?
+    '''
+    params = [until]
+    if status:
+        query += ' AND payments.status=?'
+        params.append(status)
+    query += ' ORDER BY payments.next_pay_date'
+    return db.execute(query, params).fetchall()
+
+# --- Exchange rates and revenue ---
+#
+# exchange_rates holds the KHR per USD rate in force from each effective
+# date. A payment's own khr_rate wins; rows without one use the rate in force
+# on their pay_date. Discounts, net amounts and riel totals are derived once,
+# in the payment_revenue view, so invoices, exports and the payment pages all
+# use the same figures and totals are summed by SQLite rather than row by row.
+
+RATES_START = '0001-01-01'
+
+def rate_on(date_sql):
+    return (f'(SELECT khr_per_usd FROM exchange_rates WHERE effective_date <= {date_sql} '
+            'ORDER BY effective_date DESC LIMIT 1)')
+
+def khr_rate(r):
+    return f"COALESCE({r}.khr_rate, {rate_on(f'IFNULL({r}.pay_date, date())')}, {DEFAULT_KHR_RATE})"
+
+def install_rates(db):
+    db.execute('''
+        CREATE TABLE IF NOT EXISTS exchange_rates (
+            effective_date TEXT PRIMARY KEY,
+            khr_per_usd INTEGER NOT NULL
+        ) WITHOUT ROWID
+    ''')
+    db.execute('INSERT OR IGNORE INTO exchange_rates (effective_date, khr_per_usd) SELECT ?, ? '
+               'WHERE NOT EXISTS (SELECT 1 FROM exchange_rates)', (RATES_START, DEFAULT_KHR_RATE))
+    amount = 'IFNULL(payments.amount, 0)'
+    discount = f'IFNULL(payments.discount, {DEFAULT_DISCOUNT})'
+    db.execute('DROP VIEW IF EXISTS payment_revenue')
+    db.execute(f'''
+        CREATE VIEW payment_revenue AS
+        SELECT id, student_id, status, pay_date, next_pay_date, amount, discount, khr_rate,
+               amount * discount AS discount_usd, amount * (1 - discount) AS net_usd,
+               CAST(ROUND(amount * (1 - discount) * khr_rate) AS INTEGER) AS net_khr
+        FROM (SELECT payments.id, payments.student_id, payments.status, payments.pay_date,
+                     payments.next_pay_date, {amount} AS amount, {discount} AS discount,
+                     {khr_rate('payments')} AS khr_rate
+              FROM payments)
+    ''')
+
+def rates(db):
+    return db.execute('SELECT * FROM exchange_rates ORDER BY effective_date DESC').fetchall()
+
+def current_rate(db, on=None):
+    return db.execute(f'SELECT {rate_on("?")}', (on or datetime.date.today().isoformat(),)).fetchone()[0]
+
+def set_rate(db, effective_date, khr_per_usd):
+    # Stored invoices need no invalidating here: a payment priced from
+    # exchange_rates hashes its effective rate, so the next print of it
+    # renders a new invoice and earlier ones stay on record as issued.
+    db.execute('''
+        INSERT INTO exchange_rates (effective_date, khr_per_usd) VALUES (?, ?)
+        ON CONFLICT(effective_date) DO UPDATE SET khr_per_usd = excluded.khr_per_usd
+    ''', (datetime.date.fromisoformat(iso_date(effective_date)).isoformat(), int(khr_per_usd)))
+
+REVENUE_GROUPS = {
+    'month': 'substr(revenue.pay_date, 1, 7)',
+    'class': 'students.class',
+    'grade': 'students.grade',
+}
+
+def revenue(db, by=None, status='Paid'):
+    # Gross, discount and net totals over payment_revenue, in one row or one
+    # row per REVENUE_GROUPS key (newest month first).
+    group = REVENUE_GROUPS[by] if by else "''"
+    query = f'''
+        SELECT {group} AS key, COUNT(*) AS payments, IFNULL(SUM(revenue.amount), 0) AS gross_usd,
+               IFNULL(SUM(revenue.discount_usd), 0) AS discount_usd, IFNULL(SUM(revenue.net_usd), 0) AS net_usd,
+               IFNULL(SUM(revenue.net_khr), 0) AS net_khr
+        FROM payment_revenue AS revenue JOIN students ON students.id = revenue.student_id
+    '''
+    params = []
+    if status:
+        query += ' WHERE revenue.status=?'
+        params.append(status)
+    if not by:
+        return db.execute(query, params).fetchone()
+    query += ' GROUP BY 1 ORDER BY 1' + (' DESC' if by == 'month' else '')
+    return db.execute(query, params).fetchall()
@@ -0,0 +1,132 @@
+import base64
+import json
+from html import escape
+from urllib.parse import urlencode
+from flask import request, current_app
+from markupsafe import Markup
+
+# --- Keyset pagination ---
+#
+# Pages are addressed by the (sort value, id) of the row just before or just
+# after them rather than by an OFFSET, so every page is a single index seek
+# followed by LIMIT page_size rows no matter how deep into the table it is.
+# Sort columns must be indexed and hold no NULLs.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+class Page:
+    def __init__(self, rows, sort, order, size, prefix, next_cursor=None, prev_cursor=None):
+        self.rows = rows
+        self.sort = sort
+        self.order = order
+        self.size = size
+        self.prefix = prefix
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+def encode_cursor(value, key):
+    raw = json.dumps([value, key], separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, key = json.loads(raw)
+    except (ValueError, TypeError):
+        return None
+    # Only scalars can be bound as the sort value; a crafted cursor holding
+    # a list or object is treated as no cursor at all.
+    if not isinstance(value, (str, int, float, type(None))) or not isinstance(key, int) or isinstance(key, bool):
+        return None
+    return value, key
+
+def page_size(args, prefix=''):
+    default = current_app.config.get('LIST_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+    try:
+        size = int(args.get(prefix + 'size', default))
+    except ValueError:
+        size = default
+    return max(1, min(size, current_app.config.get('LIST_MAX_PAGE_SIZE', MAX_PAGE_SIZE)))
+
+def paginate(db, columns, source, key, sorts, filters=(), params=(), args=None, prefix='', default_order='desc'):
+    # ``sorts`` maps the sort names accepted in the query string to SQL
+    # expressions, the first being the default; ``key`` is the unique id
+    # column used as tie-breaker. Query string keys are namespaced by
+    # ``prefix`` so several lists can share one page.
+    args = request.values if args is None else args
+    sort = args.get(prefix + 'sort')
+    if sort not in sorts:
+        sort = next(iter(sorts))
+    order = args.get(prefix + 'order', default_order)
+    if order not in ('asc', 'desc'):
+        order = default_order
+    size = page_size(args, prefix)
+    expr = sorts[sort]
+
+    after = decode_cursor(args.get(prefix + 'after', ''))
+    before = None if after else decode_cursor(args.get(prefix + 'before', ''))
+    forward = before is None
+    ascending = (order == 'asc') == forward
+    where = list(filters)
+    values = list(params)
+    cursor = after or before
+    if cursor:
+        where.append(f'({expr}, {key}) {">" if ascending else "<"} (?, ?)')
+        values.extend(cursor)
+    direction = 'ASC' if ascending else 'DESC'
+    query = f'SELECT {columns}, {expr} AS sort_value, {key} AS row_key FROM {source}'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    query += f' ORDER BY {expr} {direction}, {key} {direction} LIMIT ?'
+    rows = db.execute(query, values + [size + 1]).fetchall()
+
+    more = len(rows) > size
+    rows = rows[:size]
+    if not forward:
+        rows.reverse()
+    page = Page(rows, sort, order, size, prefix)
+    if rows:
+        first, last = rows[0], rows[-1]
+        if (more if forward else cursor is not None):
+            page.next_cursor = encode_cursor(last['sort_value'], last['row_key'])
+        if (cursor is not None if forward else more):
+            page.prev_cursor = encode_cursor(first['sort_value'], first['row_key'])
+    return page
+
+# --- Links ---
+
+def _url(prefix, **changes):
+    args = {k: v for k, v in request.values.items(multi=False)
+            if not k.startswith(prefix) or k[len(prefix):] not in ('after', 'before')}
+    for name, value in changes.items():
+        if value is None:
+            args.pop(prefix + name, None)
+        else:
+            args[prefix + name] = value
+    return request.path + '?' + urlencode(args)
+
+def sort_link(page, sort, label):
+    order = 'desc'
+    arrow = ''
+    if page.sort == sort:
+        order = 'asc' if page.order == 'desc' else 'desc'
+        arrow = ' &#9660;' if page.order == 'desc' else ' &#9650;'
+    href = _url(page.prefix, sort=sort, order=order)
+    return Markup(f'<a href="{escape(href)}" class="text-reset text-decoration-none">{escape(label)}{arrow}</a>')
+
+def pager(page):
+    links = []
+    if page.prev_cursor:
+        links.append(f'<a class="btn btn-sm btn-light" href="{escape(_url(page.prefix, before=page.prev_cursor))}">&laquo; Prev</a>')
+    if page.next_cursor:
+        links.append(f'<a class="btn btn-sm btn-light" href="{escape(_url(page.prefix, after=page.next_cursor))}">Next &raquo;</a>')
+    if not links:
+        return Markup('')
+    return Markup('<div class="d-flex gap-2 justify-content-end mt-2">' + ''.join(links) + '</div>')
@@ -1,21 +1,12 @@
 from flask import Flask, request, redirect, session, Blueprint
-import sqlite3
+from database import get_db, stat, stat_keys
+import directory
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
 teacher_bp = Blueprint('teacher', __name__)
 
-def get_db():
-    conn = sqlite3.connect('school.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
-def get_cred_db():
-    conn = sqlite3.connect('credential.db')
-    conn.row_factory = sqlite3.Row
-    return conn
-
 @teacher_bp.route('/teacher-dashboard')
 def teacher_dashboard():
     if 'teacher_id' not in session:
@@ -28,13 +19,12 @@ def teacher_dashboard():
     ).fetchall()
 
     # Stats for cards
-    class_count = len(set(row["class"] for row in students))
-    student_count = len(students)
-    grade_count = len(set(row["grade"] for row in students))
+    scope = f"teacher.{session['teacher_id']}"
+    class_count = len(stat_keys(db, scope + '.class'))
+    student_count = stat(db, scope + '.students')
+    grade_count = len(stat_keys(db, scope + '.grade'))
 
-    cred_db = get_cred_db()
-    teachers = cred_db.execute('SELECT username FROM teachers WHERE id=?', (session['teacher_id'],)).fetchone()
-    teachers_name = teachers['username'] if teachers else 'Unknown'
+    teachers_name = directory.name(session['teacher_id'])
 
     html = '''
     <!DOCTYPE html>
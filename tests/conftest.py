@@ -0,0 +1,21 @@
+import os
+
+import pytest
+
+import benchmark
+import database
+from app import app
+
+@pytest.fixture(scope='module')
+def school(tmp_path_factory):
+    # A populated school in a temporary directory; benchmark.py builds the
+    # same fixture for its timings.
+    directory = str(tmp_path_factory.mktemp('school'))
+    saved = dict(app.config)
+    app.config['INVOICE_DIR'] = os.path.join(directory, 'invoices')
+    app.config['EXPORT_CACHE_DIR'] = os.path.join(directory, 'export-cache')
+    benchmark.make_fixture(directory, students=2000, reports=5000)
+    yield app
+    database.close_pools()
+    app.config.clear()
+    app.config.update(saved)
@@ -0,0 +1,19 @@
+import database
+import invoices
+import ledger
+
+def test_rate_change_reprices_fallback_invoices(school):
+    with school.test_request_context():
+        db = database.get_db()
+        db.execute('UPDATE payments SET khr_rate=NULL WHERE student_id=1')
+        db.execute('UPDATE payments SET khr_rate=NULL, pay_date=NULL WHERE student_id=2')
+        db.execute('UPDATE payments SET khr_rate=4000 WHERE student_id=3')
+        db.commit()
+        before = {student_id: invoices.get_or_create(db, student_id) for student_id in (1, 2, 3)}
+        ledger.set_rate(db, '2020-01-01', 4250)
+        db.commit()
+        after = {student_id: invoices.get_or_create(db, student_id) for student_id in (1, 2, 3)}
+        assert after[1]['content_hash'] != before[1]['content_hash']
+        assert after[2]['content_hash'] != before[2]['content_hash']
+        assert after[3]['content_hash'] == before[3]['content_hash']
+        assert invoices.state(db, 1)['net_khr'] == round(invoices.state(db, 1)['net_usd'] * 4250)
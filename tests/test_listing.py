@@ -0,0 +1,15 @@
+import benchmark
+from listing import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor('3B', 2500)) == ('3B', 2500)
+    assert decode_cursor(encode_cursor(None, 7)) == (None, 7)
+
+def test_crafted_cursors_are_ignored():
+    # [[1],2], {"a":1} and ["a",[1]]: nothing SQLite could bind
+    for cursor in ('W1sxXSwyXQ', 'eyJhIjoxfQ', 'WyJhIixbMV1d', 'not base64!', ''):
+        assert decode_cursor(cursor) is None
+
+def test_crafted_cursor_on_admin_page(school):
+    response = benchmark.client('admin').get('/admin?r_after=W1sxXSwyXQ&s_before=W1sxXSwyXQ')
+    assert response.status_code == 200
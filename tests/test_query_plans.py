@@ -0,0 +1,103 @@
+import pytest
+
+import benchmark
+import database
+import export
+from listing import encode_cursor
+
+# Every statement the dashboards and exports issue while serving REQUESTS is
+# captured off the real connections and explained. A filtered query that
+# scans a table without an index fails, as does an unfiltered one that sorts
+# the whole table instead of walking an index. Listing a whole table is
+# expected to scan it, and sorting the rows a filter picked out is cheap.
+
+REQUESTS = [
+    ('admin', 'GET', '/admin', None),
+    ('admin', 'GET', f'/admin?r_after={encode_cursor(2500, 2500)}&s_after={encode_cursor(1000, 1000)}', None),
+    ('admin', 'GET', f'/admin?r_sort=class&r_order=asc&r_after={encode_cursor("3B", 2500)}', None),
+    ('admin', 'GET', f'/admin?r_sort=class&r_before={encode_cursor("3B", 2500)}', None),
+    ('admin', 'POST', '/admin', {'filter_type': 'reports', 'teacher': '1', 'class': '1A', 'student_name': 'Student'}),
+    ('admin', 'GET', f'/admin?filter_type=reports&teacher=1&r_after={encode_cursor(2500, 2500)}', None),
+    ('admin', 'GET', f'/admin?filter_type=reports&class=1A&r_sort=class&r_after={encode_cursor("1A", 2500)}', None),
+    ('admin', 'POST', '/admin', {'filter_type': 'students', 'teacher': '2', 'class': '2B', 'student_name': 'Student 1'}),
+    ('admin', 'GET', f'/admin?filter_type=students&class=2B&s_sort=name&s_after={encode_cursor("Student 5", 100)}', None),
+    ('admin', 'GET', f'/admin/teachers?sort=username&after={encode_cursor("teacher5", 5)}', None),
+    ('admin', 'GET', f'/admin/teachers?after={encode_cursor(5, 5)}', None),
+    ('admin', 'GET', '/admin/staffs?sort=username&order=asc', None),
+    ('admin', 'GET', f'/admin/students?sort=class&after={encode_cursor("3B", 1000)}', None),
+    ('admin', 'GET', f'/admin/students?sort=name&before={encode_cursor("Student 5", 100)}', None),
+    ('admin', 'GET', '/admin/invoices', None),
+    *[('admin', 'GET', f'/export/{table}.csv?{query}', None)
+      for table in export.EXPORTS for query in ('teacher=2&class=1A', 'teacher=2', 'class=1A')],
+    ('staff', 'GET', '/staff-dashboard', None),
+    ('staff', 'GET', '/staff-dashboard?due_days=0', None),
+    ('staff', 'GET', '/staff-dashboard?due_days=30&due_status=Not+Paid', None),
+    ('staff', 'POST', '/staff-dashboard', {'teacher': '1', 'class': '1A', 'student_name': 'Student'}),
+    ('staff', 'GET', '/staff/manage-payments', None),
+    ('staff', 'GET', '/staff/print-invoice/3', None),
+    ('staff', 'GET', '/staff/print-invoices?class=1A&status=Paid&month=2026-09&format=html', None),
+    ('teacher', 'GET', '/teacher-dashboard', None),
+]
+
+@pytest.fixture(scope='module')
+def invoiced(school):
+    # An empty invoices table analyzes as free to sort, so fill it in.
+    db = database.connect(school.config['SCHOOL_DB'])
+    db.executemany(
+        'INSERT INTO invoices (student_id, invoice_no, created_at, content_hash) VALUES (?, ?, ?, ?)',
+        [(i, f'Old-{i:04d}', f'2026-09-{i % 28 + 1:02d}T12:00:00', f'{i:064x}') for i in range(10, 2001)]
+    )
+    db.commit()
+    db.close()
+    return school
+
+def capture(monkeypatch):
+    # Traces every connection opened from here on, keyed by what it was
+    # opened on so each statement can be explained against the same schema.
+    statements = {}
+    connect = database.connect
+
+    def traced(path, pragmas=None, attach=None):
+        conn = connect(path, pragmas, attach)
+        conn.set_trace_callback(statements.setdefault((path, tuple((attach or {}).items())), []).append)
+        return conn
+
+    monkeypatch.setattr(database, 'connect', traced)
+    database.close_pools()
+    return statements
+
+def problems(conn, sql):
+    found = []
+    filtered = ' WHERE ' in ' '.join(sql.split()).upper()
+    for row in conn.execute('EXPLAIN QUERY PLAN ' + sql):
+        detail = row[3]
+        indexed = ' USING ' in detail or ' VIRTUAL TABLE INDEX ' in detail
+        if filtered and detail.startswith('SCAN ') and not indexed and detail != 'SCAN CONSTANT ROW':
+            found.append(detail)
+        elif not filtered and detail.startswith('USE TEMP B-TREE') and 'ORDER BY' in detail:
+            found.append(detail)
+    return found
+
+@pytest.mark.parametrize('analyzed', [False, True], ids=['fresh', 'analyzed'])
+def test_dashboard_queries_use_indexes(invoiced, monkeypatch, analyzed):
+    if analyzed:
+        db = database.connect(invoiced.config['SCHOOL_DB'], attach={'cred': invoiced.config['CREDENTIAL_DB']})
+        db.execute('ANALYZE')
+        db.execute('ANALYZE cred')
+        db.close()
+    statements = capture(monkeypatch)
+    for role, method, path, data in REQUESTS:
+        response = benchmark.client(role).open(path, method=method, data=data)
+        assert response.status_code == 200, (path, response.status_code)
+        response.get_data()
+        response.close()
+    database.close_pools()
+
+    found = []
+    for (path, attach), traced in statements.items():
+        conn = database.connect(path, attach=dict(attach))
+        for sql in dict.fromkeys(traced):
+            if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+                found += [f"{' '.join(sql.split())} -> {detail}" for detail in problems(conn, sql)]
+        conn.close()
+    assert not found, '\n'.join(found)
@@ -0,0 +1,16 @@
+import os
+
+import benchmark
+
+# App import plus init_db on a fresh database, with Flask already loaded;
+# typically 35-70 ms, so the budget leaves room for a slow runner.
+STARTUP_BUDGET_MS = float(os.environ.get('STARTUP_BUDGET_MS', 150))
+
+def test_startup_within_budget():
+    # Best of three, so one descheduled run does not fail the suite.
+    best = min(import_ms + init_ms for import_ms, init_ms, _ in (benchmark.cold_start() for _ in range(3)))
+    assert best < STARTUP_BUDGET_MS, f'{best:.0f} ms over the {STARTUP_BUDGET_MS:.0f} ms budget'
+
+def test_heavy_modules_load_lazily():
+    _, _, times = benchmark.cold_start()
+    assert [name for name in benchmark.LAZY_MODULES if name in times] == []